@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""
+Load test for the web interface
+Drives concurrent page renders, result queries, CSV exports and crawl jobs
+against the Flask app with a stubbed Telegram backend, at several result
+store sizes, and reports throughput, latency percentiles, worker memory and
+error rates.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import signal
+import shutil
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Words used for synthetic channel titles so search has something to match
+TITLE_WORDS = ["crypto", "jobs", "news", "design", "python", "music", "travel", "remote",
+               "startup", "memes", "finance", "books", "science", "health", "sport"]
+
+def prepare_environment(work_dir: str):
+    """Point the app at a scratch directory so the real store and temp files are untouched."""
+    os.environ['RESULTS_DB'] = os.path.join(work_dir, 'data', 'crawler.db')
+    os.environ.setdefault('TELEGRAM_API_ID', '1')
+    os.environ.setdefault('TELEGRAM_API_HASH', 'load-test')
+    os.environ['DELAY_BETWEEN_CHANNELS'] = '0'
+    os.chdir(work_dir)
+    if REPO_DIR not in sys.path:
+        sys.path.insert(0, REPO_DIR)
+
+def create_app():
+    """Return the Flask app with the Telegram crawler replaced by a stub.
+
+    Also used as the gunicorn entry point: gunicorn 'load_test:create_app()'
+    """
+    import main
+    import telegram_crawler
+
+    crawl_latency = float(os.getenv('LOAD_TEST_CRAWL_LATENCY', '0.05'))
+
+    class StubCrawler(telegram_crawler.TelegramCrawler):
+        """Stands in for TelegramCrawler without touching the network; returns synthetic recommendations."""
+
+        async def connect(self) -> bool:
+            return True
+
+        async def ensure_connected(self) -> bool:
+            return True
+
+        async def get_similar_channels(self, channel_username: str) -> List[Dict[str, Any]]:
+            import asyncio
+            await asyncio.sleep(crawl_latency)
+            self.api_calls += 12
+            return [synthetic_channel(random.randrange(10 ** 7)) for _ in range(10)]
+
+        async def close(self):
+            pass
+
+    telegram_crawler.TelegramCrawler = StubCrawler
+    return main.app
+
+def synthetic_channel(index: int) -> Dict[str, Any]:
+    """Build one synthetic channel record."""
+    title = " ".join(random.sample(TITLE_WORDS, 3)).title()
+    return {
+        "title": title,
+        "username": f"load_{index}",
+        "url": f"https://t.me/load_{index}",
+        "members": random.choice([None, random.randrange(10 ** 6)]),
+        "description": f"Synthetic {title.lower()} channel",
+        "timestamp": None
+    }
+
+def seed_store(target_size: int, current_size: int, sources: int = 500) -> int:
+    """Grow the results store to target_size channels; returns the new size."""
+    import telegram_crawler
+
+    store = telegram_crawler.ResultsStore(os.environ['RESULTS_DB'])
+    try:
+        batch = []
+        for index in range(current_size, target_size):
+            batch.append(synthetic_channel(index))
+            if len(batch) == 1000:
+                store.add_recommendations(f"seed_{index % sources}", batch)
+                batch = []
+        if batch:
+            store.add_recommendations(f"seed_{target_size % sources}", batch)
+    finally:
+        store.close()
+    return target_size
+
+def percentile(samples: List[float], pct: float) -> float:
+    """Nearest-rank percentile of a list of samples."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[rank]
+
+def rss_mb(pid: int) -> float:
+    """Resident set size of a process in MB, read from /proc."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+def child_pids(parent_pid: int) -> List[int]:
+    """PIDs whose parent is parent_pid (gunicorn workers)."""
+    children = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            if int(fields[1]) == parent_pid:
+                children.append(int(entry))
+        except (OSError, IndexError, ValueError):
+            continue
+    return children
+
+def send_request(base_url: str, method: str, path: str) -> Dict[str, Any]:
+    """Send one request and return its status, latency and byte count."""
+    request = urllib.request.Request(base_url + path, method=method,
+                                     data=b"" if method == "POST" else None)
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=120) as response:
+            size = len(response.read())
+            status = response.status
+    except urllib.error.HTTPError as e:
+        size, status = 0, e.code
+    except Exception:
+        size, status = 0, None
+    return {"status": status, "latency": time.perf_counter() - started, "bytes": size}
+
+def run_scenario(base_url: str, name: str, method: str, path: str, total: int,
+                 concurrency: int, memory_pids) -> Dict[str, Any]:
+    """Fire `total` requests with `concurrency` clients and summarize them."""
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda _: send_request(base_url, method, path), range(total)))
+    duration = time.perf_counter() - started
+
+    latencies = [r["latency"] * 1000 for r in results]
+    errors = sum(1 for r in results if r["status"] is None or r["status"] >= 400)
+    return {
+        "scenario": name,
+        "requests": total,
+        "rps": round(total / duration, 1) if duration else 0.0,
+        "p50_ms": round(percentile(latencies, 50), 1),
+        "p90_ms": round(percentile(latencies, 90), 1),
+        "p99_ms": round(percentile(latencies, 99), 1),
+        "max_ms": round(max(latencies), 1) if latencies else 0.0,
+        "error_rate": round(errors / total, 4) if total else 0.0,
+        "avg_kb": round(sum(r["bytes"] for r in results) / total / 1024, 1) if total else 0.0,
+        "rss_mb": round(sum(rss_mb(pid) for pid in memory_pids()), 1),
+    }
+
+def scenarios(requests: int, concurrency: int):
+    """(name, method, path, request count) for each load scenario."""
+    heavy = max(concurrency, requests // 10)
+    return [
+        ("index", "GET", "/", requests),
+        ("results_page", "GET", "/api/results?limit=100&sort=members", requests),
+        ("results_filtered", "GET", "/api/results?limit=100&sort=recommendations&prefix=load_1&min_members=1000", requests),
+        ("search", "GET", "/api/search?q=crypto+jo&limit=50", requests),
+        ("export_csv", "GET", "/export-csv", heavy),
+        ("run_crawler", "POST", "/api/run-crawler", heavy),
+    ]
+
+def free_port() -> int:
+    """Ask the OS for an unused local port."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def serve(port: int):
+    """Serve the stubbed app with werkzeug's threaded server until terminated."""
+    from werkzeug.serving import make_server
+    server = make_server("127.0.0.1", port, create_app(), threaded=True)
+    signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown).start())
+    server.serve_forever()
+
+def start_server(workers: Optional[int], port: int):
+    """Start the app in a separate process, under werkzeug (threaded) or gunicorn.
+
+    The server never shares a process with the load generator, so memory is
+    measured for the server alone. Returns (stop function, function returning
+    the PIDs to measure memory for).
+    """
+    env = dict(os.environ, PYTHONPATH=REPO_DIR + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    if workers:
+        command = [sys.executable, "-m", "gunicorn", "--workers", str(workers),
+                   "--bind", f"127.0.0.1:{port}", "--timeout", "300", "load_test:create_app()"]
+    else:
+        command = [sys.executable, os.path.join(REPO_DIR, "load_test.py"), "--serve", str(port)]
+    process = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    def stop():
+        process.send_signal(signal.SIGTERM)
+        process.wait(timeout=30)
+    if workers:
+        return stop, lambda: child_pids(process.pid)
+    return stop, lambda: [process.pid]
+
+def wait_until_ready(base_url: str, timeout: float = 30.0):
+    """Poll the app until it answers or the timeout expires."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if send_request(base_url, "GET", "/api/results?limit=1")["status"] == 200:
+            return
+        time.sleep(0.2)
+    raise RuntimeError(f"Server at {base_url} did not become ready")
+
+def print_report(report: List[Dict[str, Any]]):
+    """Print the results as an aligned table."""
+    columns = ["size", "scenario", "requests", "rps", "p50_ms", "p90_ms", "p99_ms",
+               "max_ms", "error_rate", "avg_kb", "rss_mb"]
+    widths = {col: max(len(col), *(len(str(row[col])) for row in report)) for col in columns}
+    print("  ".join(col.ljust(widths[col]) for col in columns))
+    for row in report:
+        print("  ".join(str(row[col]).ljust(widths[col]) for col in columns))
+
+def parse_arguments():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description='Load test for the crawler web interface')
+    parser.add_argument('--sizes', default='1000,10000,100000',
+                       help='Comma-separated result store sizes to test (default: 1000,10000,100000)')
+    parser.add_argument('--requests', type=int, default=200,
+                       help='Requests per light scenario; exports and crawl jobs use a tenth (default: 200)')
+    parser.add_argument('--concurrency', type=int, default=8,
+                       help='Concurrent clients (default: 8)')
+    parser.add_argument('--gunicorn', type=int, metavar='WORKERS',
+                       help='Run the app under gunicorn with this many workers instead of werkzeug')
+    parser.add_argument('--crawl-latency', type=float, default=0.05,
+                       help='Simulated seconds per seed in the stubbed crawler (default: 0.05)')
+    parser.add_argument('--output', help='Also write the report as JSON to this file')
+    parser.add_argument('--keep', action='store_true', help='Keep the scratch directory afterwards')
+    parser.add_argument('--serve', type=int, metavar='PORT', help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+def main():
+    """Seed the store at each size and run every scenario against it."""
+    args = parse_arguments()
+    if args.serve:
+        # Server process started by start_server(); the environment is inherited
+        serve(args.serve)
+        return
+    sizes = sorted(int(size) for size in args.sizes.split(','))
+    output_path = os.path.abspath(args.output) if args.output else None
+
+    work_dir = tempfile.mkdtemp(prefix="crawler_load_test_")
+    os.environ['LOAD_TEST_CRAWL_LATENCY'] = str(args.crawl_latency)
+    prepare_environment(work_dir)
+
+    # Channels for the crawl-job scenario
+    with open('temp_channels.json', 'w') as f:
+        json.dump([f"seed_{index}" for index in range(5)], f)
+
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    stop_server, memory_pids = start_server(args.gunicorn, port)
+    report = []
+    try:
+        wait_until_ready(base_url)
+        current_size = 0
+        for size in sizes:
+            print(f"Seeding result store to {size} channels...")
+            current_size = seed_store(size, current_size)
+            for name, method, path, total in scenarios(args.requests, args.concurrency):
+                row = run_scenario(base_url, name, method, path, total, args.concurrency, memory_pids)
+                row["size"] = size
+                report.append(row)
+                print(f"  {name}: {row['rps']} req/s, p99 {row['p99_ms']} ms, errors {row['error_rate']:.2%}")
+    finally:
+        stop_server()
+        if not args.keep:
+            os.chdir(REPO_DIR)
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    print()
+    print_report(report)
+    if output_path:
+        with open(output_path, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Report saved to {output_path}")
+
+if __name__ == '__main__':
+    main()
@@ -9,9 +9,12 @@ import asyncio
 import logging
 import csv
 import io
+import atexit
 import secrets
+import threading
 from datetime import datetime
-from flask import Flask, render_template, request, redirect, url_for, session, jsonify, Response
+from dotenv import load_dotenv
+from flask import Flask, render_template, request, redirect, url_for, session, jsonify, Response, g
 
 # Configure logging
 logging.basicConfig(
@@ -27,7 +30,6 @@ import telegram_crawler
 class TempStorage:
     """Class for storing data in files instead of relying on session or memory."""
     _channels_file = 'temp_channels.json'
-    _results_file = 'temp_results.json'
     
     @classmethod
     def _ensure_dirs(cls):
@@ -44,16 +46,6 @@ class TempStorage:
         except Exception as e:
             logger.error(f"Error saving channels to file: {e}")
     
-    @classmethod
-    def set_results(cls, value):
-        """Set the results value."""
-        cls._ensure_dirs()
-        try:
-            with open(cls._results_file, 'w') as f:
-                json.dump(value, f)
-        except Exception as e:
-            logger.error(f"Error saving results to file: {e}")
-    
     @classmethod
     def channels(cls):
         """Get the channels value."""
@@ -64,22 +56,105 @@ class TempStorage:
         except Exception as e:
             logger.error(f"Error loading channels from file: {e}")
         return []
+
+class CrawlerRuntime:
+    """Long-lived event loop thread that owns one authorized Telegram client per session.
+    
+    Crawl jobs borrow the client instead of connecting and disconnecting each time,
+    so the MTProto handshake is paid once and Telethon's entity cache stays warm.
+    A client is rebuilt when the settings it was created from change.
+    """
+    # Config keys baked into a crawler when it is built
+    CRAWLER_SETTINGS = ('telegram_phone', 'call_timeouts', 'max_retries', 'retry_backoff', 'hedge_percentile',
+                        'adaptive_rate', 'rate_state_file', 'max_flood_wait', 'delay_between_channels')
+    _loop = None
+    _thread = None
+    _crawlers = {}
+    _settings = {}
+    _locks = {}
+    _guard = threading.Lock()
     
     @classmethod
-    def results(cls):
-        """Get the results value."""
-        try:
-            if os.path.exists(cls._results_file):
-                with open(cls._results_file, 'r') as f:
-                    return json.load(f)
-        except Exception as e:
-            logger.error(f"Error loading results from file: {e}")
-        return {}
+    def _ensure_loop(cls):
+        """Start the background event loop on first use (after any worker fork)."""
+        with cls._guard:
+            if cls._loop is None or not cls._thread.is_alive():
+                if cls._loop is not None:
+                    # Clients and locks are bound to the dead loop and cannot be reused
+                    logger.warning("Shared Telegram event loop stopped; discarding its clients")
+                    cls._crawlers.clear()
+                    cls._settings.clear()
+                    cls._locks.clear()
+                cls._loop = asyncio.new_event_loop()
+                cls._thread = threading.Thread(
+                    target=cls._loop.run_forever, name="telegram-client-loop", daemon=True
+                )
+                cls._thread.start()
+                logger.info("Started shared Telegram event loop")
+        return cls._loop
+    
+    @classmethod
+    async def _crawl(cls, channels, config):
+        """Borrow the client for the configured session and run one crawl on it."""
+        key = (config.get('telegram_session', 'crawler'), config['telegram_api_id'], config['telegram_api_hash'])
+        if key not in cls._locks:
+            cls._locks[key] = asyncio.Lock()
+        
+        # One crawl at a time per client; the crawl loop itself is sequential
+        async with cls._locks[key]:
+            settings = {name: config.get(name) for name in cls.CRAWLER_SETTINGS}
+            if key in cls._crawlers and cls._settings[key] != settings:
+                logger.info("Crawler settings changed; rebuilding the shared Telegram client")
+                await cls._crawlers.pop(key).close()
+            if key not in cls._crawlers:
+                cls._crawlers[key] = telegram_crawler.TelegramCrawler.from_config(config)
+                cls._settings[key] = settings
+            return await telegram_crawler.process_channels(channels, config, crawler=cls._crawlers[key])
+    
+    @classmethod
+    def run_crawl(cls, channels, config):
+        """Run a crawl on the shared loop and block until it finishes."""
+        loop = cls._ensure_loop()
+        future = asyncio.run_coroutine_threadsafe(cls._crawl(channels, config), loop)
+        return future.result()
+    
+    @classmethod
+    def shutdown(cls):
+        """Disconnect all shared clients and stop the loop."""
+        if cls._loop is None or not cls._thread.is_alive():
+            return
+        for crawler in list(cls._crawlers.values()):
+            try:
+                asyncio.run_coroutine_threadsafe(crawler.close(), cls._loop).result(timeout=10)
+            except Exception as e:
+                logger.error(f"Error closing Telegram client: {e}")
+        cls._crawlers.clear()
+        cls._settings.clear()
+        cls._locks.clear()
+        cls._loop.call_soon_threadsafe(cls._loop.stop)
+
+atexit.register(CrawlerRuntime.shutdown)
 
 # Initialize Flask app
 app = Flask(__name__)
 app.secret_key = os.environ.get("SESSION_SECRET", secrets.token_hex(16))
 
+# Upper bound for the page size accepted by /api/results
+MAX_RESULTS_PAGE_SIZE = 500
+
+def get_results_store():
+    """Return the results store for the current request, opening it on first use."""
+    if 'results_store' not in g:
+        g.results_store = telegram_crawler.ResultsStore(os.getenv('RESULTS_DB'))
+    return g.results_store
+
+@app.teardown_appcontext
+def close_results_store(exception):
+    """Close the per-request results store."""
+    store = g.pop('results_store', None)
+    if store is not None:
+        store.close()
+
 @app.route('/', methods=['GET', 'POST'])
 def index():
     """Single-page application for Telegram Similar Channels Crawler."""
@@ -103,21 +178,13 @@ def index():
         elif input_type == 'start_crawler':
             return handle_start_crawler()
     
-    # Prepare context for the template
-    results = TempStorage.results()
-    logger.info(f"Before render - Results exists: {bool(results)}")
-    logger.info(f"Results type: {type(results)}")
-    logger.info(f"Results value: {results}")
-    if results:
-        logger.info(f"Results keys: {list(results.keys()) if isinstance(results, dict) else 'Not a dict'}")
-        logger.info(f"Similar channels in results: {bool(isinstance(results, dict) and 'similar_channels' in results)}")
-        if isinstance(results, dict) and 'similar_channels' in results:
-            logger.info(f"Similar channels count: {len(results['similar_channels'])}")
-            logger.info(f"Channel names: {list(results['similar_channels'].keys())}")
+    # Results are fetched page by page from /api/results, so only a flag is rendered here
+    has_results = get_results_store().has_results()
+    logger.info(f"Before render - Results exists: {has_results}")
     
     context = {
         'channels': TempStorage.channels(),
-        'results': results,
+        'has_results': has_results,
         'telegram_api_id': os.getenv('TELEGRAM_API_ID', ''),
         'telegram_api_hash': os.getenv('TELEGRAM_API_HASH', ''),
         'telegram_phone': os.getenv('TELEGRAM_PHONE', ''),
@@ -318,30 +385,19 @@ def handle_start_crawler():
         # Debug channels before processing
         logger.info(f"Before processing - Channels: {channels}")
         
-        load_dotenv() # ADD THIS LINE
+        load_dotenv()
         # Load config from environment variables
         config = telegram_crawler.load_config()
         
-        # Run the crawler
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        results = loop.run_until_complete(
-            telegram_crawler.process_channels(channels, config)
-        )
-        loop.close()
+        # Run the crawler on the shared client
+        results = CrawlerRuntime.run_crawl(channels, config)
         
         # Debug the results
         logger.info(f"Crawler Results: {results}")
         
-        # Store results in TempStorage only
-        TempStorage.set_results(results)
-        
-        # Debug after storing
-        logger.info(f"After processing - TempStorage results: {bool(TempStorage.results())}")
         logger.info(f"Result keys: {list(results.keys())}")
         if 'similar_channels' in results:
             logger.info(f"Similar channels count: {len(results['similar_channels'])}")
-            logger.info(f"Channel names: {list(results['similar_channels'].keys())}")
         
         logger.info("Crawler completed successfully")
         return redirect(url_for('index', _anchor='results'))
@@ -363,31 +419,19 @@ def api_run_crawler():
         }), 400
     
     try:
-        load_dotenv() # ADD THIS LINE
+        load_dotenv()
         # Load config from environment variables
         config = telegram_crawler.load_config()
         
-        # Run the crawler in a separate thread/process in a real app
-        # For simplicity, we'll run it synchronously here
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        results = loop.run_until_complete(
-            telegram_crawler.process_channels(channels, config)
-        )
-        loop.close()
+        # Run the crawler on the shared client; the request waits for the result
+        results = CrawlerRuntime.run_crawl(channels, config)
         
-        # Debug before storing
+        # Debug the results
         logger.info(f"API Crawler Results: {results}")
         
-        # Store results in TempStorage only
-        TempStorage.set_results(results)
-        
-        # Debug after storing
-        logger.info(f"API After storing - TempStorage results: {bool(TempStorage.results())}")
         logger.info(f"Result keys: {list(results.keys())}")
         if 'similar_channels' in results:
             logger.info(f"Similar channels count: {len(results['similar_channels'])}")
-            logger.info(f"Channel names: {list(results['similar_channels'].keys())}")
         
         # Report completion
         message = 'Crawler completed successfully!'
@@ -396,7 +440,7 @@ def api_run_crawler():
             'success': True,
             'message': message,
             'channels_processed': len(channels),
-            'similar_channels_found': sum(len(similar) for similar in results.get('similar_channels', {}).values())
+            'similar_channels_found': len(results.get('similar_channels', []))
         })
         
     except Exception as e:
@@ -406,34 +450,119 @@ def api_run_crawler():
             'message': f'Error: {str(e)}'
         }), 500
 
+@app.route('/api/plan', methods=['GET'])
+def api_plan():
+    """Estimate API calls and runtime for the stored channels without crawling."""
+    channels = TempStorage.channels()
+    
+    if not channels:
+        return jsonify({
+            'success': False, 
+            'message': 'No channels to plan.'
+        }), 400
+    
+    load_dotenv()
+    config = telegram_crawler.load_config(require_credentials=False)
+    plan = telegram_crawler.CrawlPlanner(config).plan(channels)
+    plan['success'] = True
+    return jsonify(plan)
+
+@app.route('/api/results', methods=['GET'])
+def api_results():
+    """Return one page of discovered channels with optional filters."""
+    try:
+        limit = request.args.get('limit', 50, type=int)
+        offset = request.args.get('offset', 0, type=int)
+        if limit < 1 or limit > MAX_RESULTS_PAGE_SIZE:
+            raise ValueError(f"limit must be between 1 and {MAX_RESULTS_PAGE_SIZE}")
+        if offset < 0:
+            raise ValueError("offset must not be negative")
+        
+        page = get_results_store().query(
+            source=request.args.get('source') or None,
+            min_members=request.args.get('min_members', type=int),
+            prefix=request.args.get('prefix') or None,
+            hop=request.args.get('hop', type=int),
+            sort=request.args.get('sort', 'members'),
+            limit=limit,
+            offset=offset,
+            cursor=request.args.get('cursor') or None,
+            scope=request.args.get('scope', 'all')
+        )
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
+    
+    page['success'] = True
+    return jsonify(page)
+
+@app.route('/api/search', methods=['GET'])
+def api_search():
+    """Full-text search over discovered channels."""
+    query = request.args.get('q', '').strip()
+    limit = request.args.get('limit', 20, type=int)
+    
+    if not query:
+        return jsonify({
+            'success': False,
+            'message': 'Query parameter q is required.'
+        }), 400
+    if limit < 1 or limit > MAX_RESULTS_PAGE_SIZE:
+        return jsonify({
+            'success': False,
+            'message': f'limit must be between 1 and {MAX_RESULTS_PAGE_SIZE}'
+        }), 400
+    
+    items = get_results_store().search(query, limit=limit)
+    return jsonify({
+        'success': True,
+        'query': query,
+        'count': len(items),
+        'items': items
+    })
+
 # Export route
 @app.route('/export-csv')
 def export_csv():
-    """Export the results as a CSV file."""
-    results = TempStorage.results()
+    """Export the results as a CSV file (the last run's by default, everything with scope=all)."""
+    store = get_results_store()
+    scope = request.args.get('scope', 'last_run')
+    if scope not in telegram_crawler.ResultsStore.SCOPES:
+        return jsonify({
+            'success': False,
+            'message': f'Unsupported scope: {scope}'
+        }), 400
     
-    if not results or 'export_data' not in results:
+    if not store.has_results():
         logger.warning("No results available to export")
         return redirect(url_for('index', _anchor='results'))
     
-    export_data = results['export_data']
-    headers = export_data['headers']
-    rows = export_data['rows']
-    
-    # Create a CSV in memory
-    output = io.StringIO()
-    writer = csv.writer(output)
+    headers = ["Source Channel", "Title", "Username", "URL", "Members", "Category"]
     
-    # Write headers and rows
-    writer.writerow(headers)
-    writer.writerows(rows)
+    def generate():
+        # Stream rows straight from the store instead of building the whole file in memory.
+        # The generator outlives the request context, so it owns its own connection.
+        export_store = telegram_crawler.ResultsStore(os.getenv('RESULTS_DB'))
+        try:
+            output = io.StringIO()
+            writer = csv.writer(output)
+            writer.writerow(headers)
+            for source, title, username, url, members in export_store.iter_export_rows(scope):
+                writer.writerow([source, title, username, url, str(members) if members else "Unknown", "Unknown"])
+                if output.tell() > 64 * 1024:
+                    yield output.getvalue()
+                    output.seek(0)
+                    output.truncate()
+            yield output.getvalue()
+        finally:
+            export_store.close()
     
-    # Prepare response
-    output.seek(0)
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
     
     return Response(
-        output.getvalue(),
+        generate(),
         mimetype='text/csv',
         headers={
             'Content-Disposition': f'attachment; filename=telegram_similar_channels_{timestamp}.csv'
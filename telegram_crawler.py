@@ -5,18 +5,33 @@ A tool to fetch similar Telegram channels.
 """
 
 import os
+import re
 import sys
 import json
 import time
+import math
+import random
+import shutil
+import tempfile
+import gzip
+import fcntl
+import zlib
+import base64
+import builtins
+import sqlite3
 import asyncio
 import logging
 import argparse
+from collections import deque
+from contextlib import contextmanager
 from datetime import datetime
-from typing import List, Dict, Any, Optional, Tuple
+from typing import List, Dict, Any, Optional, Tuple, Iterable, Iterator
 
 # Third-party dependencies
+import numpy as np
 from dotenv import load_dotenv
 from telethon import TelegramClient, errors, functions, types
+from telethon.extensions import BinaryReader
 from telethon.tl.types import Channel, Chat, User, InputPeerChannel, InputChannel
 from telethon.tl.functions.channels import GetChannelRecommendationsRequest, GetFullChannelRequest
 
@@ -103,44 +118,491 @@ class InputHandler:
             logger.error(f"Error loading input file: {e}")
             return []
     
+    @staticmethod
+    def iter_file(file_path: str) -> Iterator[str]:
+        """Yield channel usernames from a JSON or CSV file, reading CSV files line by line."""
+        if not os.path.exists(file_path):
+            logger.error(f"Input file {file_path} not found.")
+            return
+        
+        if file_path.endswith('.json'):
+            with open(file_path, 'r') as f:
+                channels = json.load(f)
+            if not isinstance(channels, list):
+                logger.error("JSON file must contain a list of channel usernames.")
+                return
+            yield from channels
+        elif file_path.endswith('.csv'):
+            with open(file_path, 'r') as f:
+                for line in f:
+                    if line.strip():
+                        yield line.strip()
+        else:
+            logger.error("Unsupported file format. Use .json or .csv")
+    
+    @staticmethod
+    def normalize_channel(channel: Any) -> Optional[str]:
+        """Return the username without its @ prefix, or None if it is not a valid username."""
+        if not channel or not isinstance(channel, str):
+            return None
+        
+        # Remove @ prefix if present
+        if channel.startswith('@'):
+            channel = channel[1:]
+        
+        # Basic validation: no spaces, reasonable length
+        if ' ' in channel or len(channel) < 3 or len(channel) > 32:
+            return None
+        return channel
+    
     @staticmethod
     def validate_channels(channels: List[str]) -> List[str]:
-        """Validate and normalize channel usernames."""
+        """Validate and normalize channel usernames, dropping case-insensitive duplicates."""
         valid_channels = []
+        seen = set()
+        duplicates = 0
         for channel in channels:
             if not channel:
                 continue
-                
-            # Remove @ prefix if present
-            if channel.startswith('@'):
-                channel = channel[1:]
-                
-            # Basic validation: no spaces, reasonable length
-            if ' ' in channel or len(channel) < 3 or len(channel) > 32:
+            
+            normalized = InputHandler.normalize_channel(channel)
+            if normalized is None:
                 logger.warning(f"Invalid channel name: {channel}")
                 continue
-                
-            valid_channels.append(channel)
             
-        logger.info(f"Validated {len(valid_channels)} channels out of {len(channels)}")
+            if normalized.lower() in seen:
+                duplicates += 1
+                continue
+            seen.add(normalized.lower())
+            valid_channels.append(normalized)
+        
+        logger.info(f"Validated {len(valid_channels)} channels out of {len(channels)}"
+                    + (f" ({duplicates} duplicates dropped)" if duplicates else ""))
         return valid_channels
 
+class Cassette:
+    """Records Telegram API responses to disk and replays them without network access.
+    
+    A cassette is a gzip-compressed JSON-lines file. Each entry holds the API
+    method, its lookup key, the observed latency and either the serialized TL
+    response or the error that was raised.
+    """
+    
+    MODES = ('record', 'replay')
+    LATENCY_MODES = ('recorded', 'zero')
+    
+    def __init__(self, path: str, mode: str, latency: str = 'zero'):
+        """Open a cassette for recording or load one for replay."""
+        if mode not in self.MODES:
+            raise ValueError(f"Unsupported cassette mode: {mode}")
+        if latency not in self.LATENCY_MODES:
+            raise ValueError(f"Unsupported replay latency: {latency}")
+        
+        self.path = path
+        self.mode = mode
+        self.latency = latency
+        self._entries = {}
+        self._file = None
+        
+        if mode == 'record':
+            cassette_dir = os.path.dirname(path)
+            if cassette_dir:
+                os.makedirs(cassette_dir, exist_ok=True)
+            self._file = gzip.open(path, 'wt', encoding='utf-8')
+        else:
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                for line in f:
+                    entry = json.loads(line)
+                    self._entries.setdefault((entry['m'], entry['k']), deque()).append(entry)
+            logger.info(f"Loaded {sum(len(e) for e in self._entries.values())} recorded responses from {path}")
+    
+    @property
+    def replaying(self) -> bool:
+        """True when responses are served from the cassette."""
+        return self.mode == 'replay'
+    
+    def _write(self, entry: Dict[str, Any]):
+        """Append one entry to the cassette file."""
+        self._file.write(json.dumps(entry, separators=(',', ':')) + "\n")
+    
+    def record(self, method: str, key: str, response: Any, latency: float):
+        """Record a successful response."""
+        self._write({
+            'm': method,
+            'k': key,
+            't': round(latency, 4),
+            'd': base64.b64encode(bytes(response)).decode('ascii')
+        })
+    
+    def record_error(self, method: str, key: str, error: Exception, latency: float):
+        """Record an error so replay raises the same exception type."""
+        self._write({
+            'm': method,
+            'k': key,
+            't': round(latency, 4),
+            'e': type(error).__name__,
+            'src': type(error).__module__,
+            'msg': str(error),
+            's': getattr(error, 'seconds', None)
+        })
+    
+    @staticmethod
+    def _rebuild_error(entry: Dict[str, Any]) -> Exception:
+        """Recreate a recorded exception, falling back to RuntimeError for unknown types.
+        
+        The recorded module decides where the name is looked up, so a builtin
+        TimeoutError is not confused with telethon's error of the same name.
+        Entries written before the module was recorded try telethon first.
+        """
+        source = entry.get('src')
+        from_telethon = source is None or source.split('.')[0] == 'telethon'
+        error_cls = getattr(errors, entry['e'], None) if from_telethon else None
+        if isinstance(error_cls, type) and issubclass(error_cls, errors.RPCError):
+            try:
+                return error_cls(request=None, capture=entry.get('s') or 0)
+            except TypeError:
+                try:
+                    return error_cls(request=None)
+                except TypeError:
+                    try:
+                        return error_cls(None, entry['msg'])
+                    except TypeError:
+                        pass
+        elif isinstance(error_cls, type) and issubclass(error_cls, Exception) and source is not None:
+            try:
+                return error_cls(entry['msg'])
+            except TypeError:
+                pass
+        error_cls = getattr(builtins, entry['e'], None) if source in (None, 'builtins') else None
+        if isinstance(error_cls, type) and issubclass(error_cls, Exception):
+            return error_cls(entry['msg'])
+        return RuntimeError(f"{entry['e']}: {entry['msg']}")
+    
+    async def replay(self, method: str, key: str) -> Any:
+        """Serve the next recorded response for a call, raising recorded errors."""
+        entries = self._entries.get((method, key))
+        if not entries:
+            raise LookupError(f"No recorded response for {method} {key}")
+        # Repeated calls consume entries in order; the last one keeps being served
+        entry = entries.popleft() if len(entries) > 1 else entries[0]
+        
+        if self.latency == 'recorded':
+            await asyncio.sleep(entry['t'])
+        if 'e' in entry:
+            raise self._rebuild_error(entry)
+        return BinaryReader(base64.b64decode(entry['d'])).tgread_object()
+    
+    def close(self):
+        """Flush and close a recording cassette."""
+        if self._file:
+            self._file.close()
+            self._file = None
+            logger.info(f"Cassette saved to {self.path}")
+
+class RateController:
+    """Per-method AIMD request rate control driven by flood-wait errors.
+    
+    Each API method has its own request rate. Every successful call raises the
+    rate additively, and every FloodWait or slow-mode error cuts it
+    multiplicatively and pauses the method for the requested wait. Learned
+    rates are saved to disk so the next run starts close to the real limit.
+    Methods with neither a configured nor a saved rate begin in slow start:
+    every success multiplies the rate until the first flood wait, after which
+    the method switches to additive increase. Rates still in slow start are
+    not saved, so they are never mistaken for learned limits.
+    """
+    
+    def __init__(self, state_file: str = None, initial_rates: Optional[Dict[str, float]] = None,
+                 default_rate: float = 1.0, increase: float = 0.02, decrease: float = 0.5,
+                 min_rate: float = 0.01, max_rate: float = 20.0, slow_start_factor: float = 1.5):
+        """Load persisted rates, falling back to the given initial rates."""
+        self.state_file = state_file or os.getenv('RATE_STATE_FILE', os.path.join('data', 'rate_state.json'))
+        self.default_rate = default_rate
+        self.increase = increase
+        self.slow_start_factor = slow_start_factor
+        self.decrease = decrease
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        
+        self.rates = dict(initial_rates or {})
+        self._configured = set(self.rates)
+        self._learned = set()  # methods with a saved rate or a flood wait this run
+        try:
+            if os.path.exists(self.state_file):
+                with open(self.state_file, 'r') as f:
+                    saved = json.load(f)
+                self.rates.update({method: float(state['rate']) for method, state in saved.items()})
+                self._learned.update(saved)
+                logger.info(f"Loaded learned request rates from {self.state_file}")
+        except Exception as e:
+            logger.warning(f"Could not load request rates from {self.state_file}: {e}")
+        
+        self.start_rates = dict(self.rates)
+        self._next_allowed = {}
+        self._increases = {}
+        self._decreases = {}
+    
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> 'RateController':
+        """Build a controller from the settings returned by load_config()."""
+        # Without learned rates, seed-level calls start at the configured static delay
+        seed_rate = 1.0 / max(config.get('delay_between_channels', 8), 0.1)
+        return cls(
+            config.get('rate_state_file'),
+            initial_rates={'get_entity': seed_rate, 'get_channel_recommendations': seed_rate}
+        )
+    
+    def rate(self, method: str) -> float:
+        """Current requests per second allowed for a method."""
+        return self.rates.setdefault(method, self.default_rate)
+    
+    async def acquire(self, method: str):
+        """Wait until the method may send its next request."""
+        now = time.monotonic()
+        # Reserve the slot before sleeping so concurrent callers queue up behind it
+        slot = max(now, self._next_allowed.get(method, now))
+        self._next_allowed[method] = slot + 1.0 / self.rate(method)
+        if slot > now:
+            await asyncio.sleep(slot - now)
+    
+    def in_slow_start(self, method: str) -> bool:
+        """True for methods without a configured or saved rate until their first flood wait."""
+        return method not in self._learned and method not in self._configured
+    
+    def pacing_seconds(self, method: str, calls: int) -> float:
+        """Time the controller needs to admit `calls` requests, including any slow-start ramp."""
+        rate = self.rate(method)
+        if not self.in_slow_start(method) or self.slow_start_factor <= 1:
+            return calls / rate
+        # Geometric ramp from the current rate up to the cap, then steady at the cap
+        ramp_calls = min(calls, max(0, math.ceil(math.log(self.max_rate / rate, self.slow_start_factor))))
+        ramp_seconds = (1 - self.slow_start_factor ** -ramp_calls) / (rate * (1 - 1 / self.slow_start_factor))
+        return ramp_seconds + (calls - ramp_calls) / self.max_rate
+    
+    def on_success(self, method: str):
+        """Multiplicative increase in slow start, additive increase afterwards."""
+        if self.in_slow_start(method):
+            self.rates[method] = min(self.max_rate, self.rate(method) * self.slow_start_factor)
+        else:
+            self.rates[method] = min(self.max_rate, self.rate(method) + self.increase)
+        self._increases[method] = self._increases.get(method, 0) + 1
+    
+    def on_flood(self, method: str, wait_seconds: float):
+        """Multiplicative decrease and a pause after a flood or slow-mode error."""
+        old_rate = self.rate(method)
+        self.rates[method] = max(self.min_rate, old_rate * self.decrease)
+        self._learned.add(method)
+        self._decreases[method] = self._decreases.get(method, 0) + 1
+        self._next_allowed[method] = max(self._next_allowed.get(method, 0), time.monotonic() + wait_seconds)
+        logger.warning(f"Flood wait of {wait_seconds}s on {method}: rate {old_rate:.3f} -> "
+                       f"{self.rates[method]:.3f} req/s")
+        self.save()
+    
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        """Current rate and adjustment counts per method."""
+        return {
+            method: {
+                "rate": round(rate, 4),
+                "start_rate": round(self.start_rates.get(method, self.default_rate), 4),
+                "increases": self._increases.get(method, 0),
+                "decreases": self._decreases.get(method, 0),
+                "slow_start": self.in_slow_start(method),
+            }
+            for method, rate in sorted(self.rates.items())
+        }
+    
+    def save(self):
+        """Persist the learned rates."""
+        try:
+            state_dir = os.path.dirname(self.state_file)
+            if state_dir:
+                os.makedirs(state_dir, exist_ok=True)
+            state = {method: {"rate": rate, "updated": datetime.now().isoformat()}
+                     for method, rate in self.rates.items() if not self.in_slow_start(method)}
+            tmp_file = self.state_file + ".tmp"
+            with open(tmp_file, 'w') as f:
+                json.dump(state, f, indent=2)
+            os.replace(tmp_file, self.state_file)
+        except Exception as e:
+            logger.error(f"Could not save request rates to {self.state_file}: {e}")
+
 class TelegramCrawler:
     """Handles the interaction with the Telegram API."""
     
-    def __init__(self, api_id: str, api_hash: str, phone: str = None, session_name: str = "crawler"):
+    # Per-method deadlines in seconds
+    DEFAULT_CALL_TIMEOUTS = {
+        'get_entity': 15.0,
+        'get_channel_recommendations': 20.0,
+        'get_full_channel': 15.0,
+    }
+    
+    # Errors that will not go away by asking again
+    PERMANENT_ERRORS = (
+        errors.ChannelPrivateError,
+        errors.UsernameNotOccupiedError,
+        errors.UsernameInvalidError,
+        errors.ChannelInvalidError,
+        errors.BadRequestError,
+        errors.ForbiddenError,
+        errors.UnauthorizedError,
+        ValueError,
+        TypeError,
+        LookupError,
+    )
+    
+    # Network hiccups and server-side failures worth retrying (TimeoutError is an OSError)
+    TRANSIENT_ERRORS = (
+        OSError,
+        errors.ServerError,
+        errors.TimedOutError,
+    )
+    
+    # Latency samples needed before hedging kicks in
+    HEDGE_MIN_SAMPLES = 20
+    
+    def __init__(self, api_id: str, api_hash: str, phone: str = None, session_name: str = "crawler",
+                 cassette: Optional[Cassette] = None, call_timeouts: Optional[Dict[str, float]] = None,
+                 max_retries: int = 2, retry_backoff: float = 1.0, hedge_percentile: Optional[float] = None,
+                 rate_controller: Optional[RateController] = None, max_flood_wait: float = 120.0):
         """Initialize the Telegram client."""
         self.api_id = api_id
         self.api_hash = api_hash
         self.phone = phone
         self.session_name = session_name
         self.client = None
+        self.cassette = cassette
+        self.api_calls = 0
+        self.call_timeouts = {**self.DEFAULT_CALL_TIMEOUTS, **(call_timeouts or {})}
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.hedge_percentile = hedge_percentile
+        self.hedged_calls = 0
+        self._latencies = {}  # method -> recent successful latencies
+        self.rate_controller = rate_controller
+        self.max_flood_wait = max_flood_wait
+    
+    @classmethod
+    def from_config(cls, config: Dict[str, Any], cassette: Optional[Cassette] = None) -> 'TelegramCrawler':
+        """Build a crawler from the settings returned by load_config()."""
+        rate_controller = RateController.from_config(config) if config.get('adaptive_rate', True) else None
+        return cls(
+            api_id=config['telegram_api_id'],
+            api_hash=config['telegram_api_hash'],
+            phone=config.get('telegram_phone'),
+            session_name=config.get('telegram_session', 'crawler'),
+            cassette=cassette,
+            call_timeouts=config.get('call_timeouts'),
+            max_retries=config.get('max_retries', 2),
+            retry_backoff=config.get('retry_backoff', 1.0),
+            hedge_percentile=config.get('hedge_percentile'),
+            rate_controller=rate_controller,
+            max_flood_wait=config.get('max_flood_wait', 120.0)
+        )
+    
+    async def _attempt(self, method: str, key: str, factory) -> Any:
+        """Make a single attempt under the method's deadline, recording it if needed."""
+        timeout = self.call_timeouts.get(method)
+        self.api_calls += 1
+        if self.cassette and self.cassette.replaying:
+            return await asyncio.wait_for(self.cassette.replay(method, key), timeout)
+        
+        if self.rate_controller:
+            await self.rate_controller.acquire(method)
+        
+        started = time.monotonic()
+        try:
+            response = await asyncio.wait_for(factory(), timeout)
+        except Exception as e:
+            if self.rate_controller and isinstance(e, errors.FloodError):
+                self.rate_controller.on_flood(method, getattr(e, 'seconds', None) or 0)
+            if self.cassette:
+                self.cassette.record_error(method, key, e, time.monotonic() - started)
+            raise
+        latency = time.monotonic() - started
+        self._latencies.setdefault(method, deque(maxlen=200)).append(latency)
+        if self.rate_controller:
+            self.rate_controller.on_success(method)
+        if self.cassette:
+            self.cassette.record(method, key, response, latency)
+        return response
+    
+    def _hedge_delay(self, method: str) -> Optional[float]:
+        """Latency after which a second copy of the request is sent, if hedging is on."""
+        samples = self._latencies.get(method)
+        if not self.hedge_percentile or not samples or len(samples) < self.HEDGE_MIN_SAMPLES:
+            return None
+        return float(np.percentile(samples, self.hedge_percentile))
+    
+    async def _hedged_attempt(self, method: str, key: str, factory) -> Any:
+        """Run an attempt, racing a duplicate if it runs past the hedge latency."""
+        delay = self._hedge_delay(method)
+        if delay is None:
+            return await self._attempt(method, key, factory)
+        
+        primary = asyncio.ensure_future(self._attempt(method, key, factory))
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done:
+            return primary.result()
+        
+        logger.info(f"Hedging {method} for {key}: no response after {delay:.2f}s")
+        self.hedged_calls += 1
+        pending = {primary, asyncio.ensure_future(self._attempt(method, key, factory))}
+        error = None
+        try:
+            # First successful response wins; only fail once both copies failed
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+    
+    async def _call(self, method: str, key: Any, factory):
+        """Run one read-only API call with deadlines, classified retries and optional hedging.
+        
+        `factory` is a zero-argument callable returning the awaitable to run. Calls are
+        recorded or replayed when a cassette is attached.
+        """
+        key = str(key)
+        attempt = 0
+        flood_retried = False
+        while True:
+            try:
+                return await self._hedged_attempt(method, key, factory)
+            except self.PERMANENT_ERRORS:
+                raise
+            except errors.FloodError as e:
+                # The rate controller has already slowed down and paused this method;
+                # retry once if the wait is short enough, otherwise let the caller handle it
+                wait_seconds = getattr(e, 'seconds', None) or 0
+                if not self.rate_controller or flood_retried or wait_seconds > self.max_flood_wait:
+                    raise
+                flood_retried = True
+                logger.warning(f"{method} for {key} hit {type(e).__name__}; retrying after {wait_seconds}s")
+            except self.TRANSIENT_ERRORS as e:
+                if attempt == self.max_retries:
+                    raise
+                attempt += 1
+                backoff = self.retry_backoff * (2 ** (attempt - 1)) * random.uniform(0.5, 1.5)
+                logger.warning(f"{method} for {key} failed ({type(e).__name__}: {e}); "
+                               f"retry {attempt}/{self.max_retries} in {backoff:.1f}s")
+                await asyncio.sleep(backoff)
     
     async def connect(self) -> bool:
         """Connect to Telegram and handle authentication."""
+        if self.cassette and self.cassette.replaying:
+            logger.info(f"Replaying Telegram responses from {self.cassette.path}; not connecting")
+            return True
+        
         try:
             logger.info(f"Attempting to connect with API ID: {self.api_id}")
-            self.client = TelegramClient(self.session_name, self.api_id, self.api_hash)
+            # Surface every flood wait instead of letting Telethon sleep inside our call deadlines,
+            # so the rate controller sees it and the retry logic classifies it
+            self.client = TelegramClient(self.session_name, self.api_id, self.api_hash, flood_sleep_threshold=0)
             await self.client.connect()
             
             if not await self.client.is_user_authorized():
@@ -173,97 +635,1217 @@ class TelegramCrawler:
             logger.error(f"Error connecting to Telegram: {e}")
             return False
     
-    async def get_similar_channels(self, channel_username: str) -> List[Dict[str, Any]]:
-        """Fetch similar channels for a given channel using Telegram's GetChannelRecommendationsRequest API."""
+    async def ensure_connected(self) -> bool:
+        """Health-check a long-lived connection, reconnecting if it dropped."""
+        if self.cassette and self.cassette.replaying:
+            return True
+        if self.client is None:
+            return await self.connect()
+        
         try:
-            # Try to resolve the entity first
-            entity = await self.client.get_entity(channel_username)
-            
-            # Check if it's a channel
-            if not isinstance(entity, Channel):
-                logger.warning(f"{channel_username} is not a channel. Skipping.")
-                return []
+            if not self.client.is_connected():
+                logger.warning("Telegram client is disconnected. Reconnecting")
+                await self.client.connect()
+            if await self.client.is_user_authorized():
+                return True
+            logger.warning("Telegram session is no longer authorized")
+        except Exception as e:
+            logger.warning(f"Telegram health check failed: {e}")
+        
+        # Start over with a fresh client
+        await self.close()
+        return await self.connect()
+    
+    async def _call_batch(self, method: str, keys: List[Any], requests: List[Any]) -> List[Any]:
+        """Send several requests of one method in a single container round trip.
+        
+        Returns one entry per request: its response, or the exception that request
+        raised. A failure of the container call as a whole is raised instead.
+        """
+        keys = [str(key) for key in keys]
+        self.api_calls += len(requests)
+        if self.cassette and self.cassette.replaying:
+            # Entries are recorded per request, so batches and single calls replay alike
+            return await asyncio.gather(*(self.cassette.replay(method, key) for key in keys),
+                                        return_exceptions=True)
+        
+        if self.rate_controller:
+            for _ in requests:
+                await self.rate_controller.acquire(method)
+        
+        started = time.monotonic()
+        try:
+            outcomes = await asyncio.wait_for(self.client(requests, ordered=False), self.call_timeouts.get(method))
+        except errors.MultiError as e:
+            outcomes = [error if error is not None else result for error, result in zip(e.exceptions, e.results)]
+        except errors.FloodError as e:
+            # A flood wait on the container applies to every request in it
+            if self.rate_controller:
+                self.rate_controller.on_flood(method, getattr(e, 'seconds', None) or 0)
+            if self.cassette:
+                for key in keys:
+                    self.cassette.record_error(method, key, e, time.monotonic() - started)
+            raise
+        latency = time.monotonic() - started
+        
+        for key, outcome in zip(keys, outcomes):
+            if isinstance(outcome, Exception):
+                if self.rate_controller and isinstance(outcome, errors.FloodError):
+                    self.rate_controller.on_flood(method, getattr(outcome, 'seconds', None) or 0)
+                if self.cassette:
+                    self.cassette.record_error(method, key, outcome, latency)
+            else:
+                if self.rate_controller:
+                    self.rate_controller.on_success(method)
+                if self.cassette:
+                    self.cassette.record(method, key, outcome, latency)
+        return outcomes
+    
+    async def _resolve_channel(self, channel_username: str) -> Optional[InputChannel]:
+        """Resolve a username, returning None if it is not a channel."""
+        entity = await self._call(
+            'get_entity', channel_username.lower(),
+            lambda: self.client.get_entity(channel_username)
+        )
+        
+        # Check if it's a channel
+        if not isinstance(entity, Channel):
+            logger.warning(f"{channel_username} is not a channel. Skipping.")
+            return None
+        return InputChannel(entity.id, entity.access_hash)
+    
+    async def _collect_similar_channels(self, channel_username: str, result: Any) -> List[Dict[str, Any]]:
+        """Turn a recommendations response into channel records, fetching member counts."""
+        similar_channels = []
+        seen_usernames = set()
+        
+        for chat in result.chats:
+            if not hasattr(chat, 'username') or not chat.username:
+                logger.debug(f"Skipping channel without username: {getattr(chat, 'title', 'Unknown')}")
+                continue
             
-            # Convert to InputChannel for API calls
-            input_channel = InputChannel(entity.id, entity.access_hash)
+            # Skip the original channel
+            if chat.username.lower() == channel_username.lower():
+                continue
             
-            # Use the GetChannelRecommendationsRequest to get similar channels
-            logger.info(f"Fetching recommendations for channel: {channel_username}")
-            result = await self.client(GetChannelRecommendationsRequest(
-                channel=input_channel
-            ))
+            # Avoid duplicates
+            if chat.username.lower() in seen_usernames:
+                continue
+                
+            seen_usernames.add(chat.username.lower())
             
-            # Process the results
-            similar_channels = []
-            seen_usernames = set()
+            # Get additional details like member count and description
+            members_count = None
+            description = None
+            try:
+                full_chat = await self._call(
+                    'get_full_channel', chat.id,
+                    lambda: self.client(GetFullChannelRequest(channel=chat))
+                )
+                members_count = full_chat.full_chat.participants_count
+                description = full_chat.full_chat.about or None
+            except Exception as e:
+                logger.debug(f"Couldn't fetch member count for {chat.username}: {str(e)}")
             
-            for chat in result.chats:
-                if not hasattr(chat, 'username') or not chat.username:
-                    logger.debug(f"Skipping channel without username: {getattr(chat, 'title', 'Unknown')}")
-                    continue
-                
-                # Skip the original channel
-                if chat.username.lower() == channel_username.lower():
-                    continue
-                
-                # Avoid duplicates
-                if chat.username.lower() in seen_usernames:
-                    continue
-                    
-                seen_usernames.add(chat.username.lower())
-                
-                # Get additional details like member count
-                members_count = None
-                try:
-                    full_chat = await self.client(GetFullChannelRequest(
-                        channel=chat
-                    ))
-                    members_count = full_chat.full_chat.participants_count
-                except Exception as e:
-                    logger.debug(f"Couldn't fetch member count for {chat.username}: {str(e)}")
-                
-                channel_info = {
-                    "title": chat.title,
-                    "username": chat.username,
-                    "url": f"https://t.me/{chat.username}",
-                    "timestamp": datetime.now().isoformat(),
-                    "members": members_count
-                }
-                
-                similar_channels.append(channel_info)
+            channel_info = {
+                "id": chat.id,
+                "title": chat.title,
+                "username": chat.username,
+                "url": f"https://t.me/{chat.username}",
+                "timestamp": datetime.now().isoformat(),
+                "members": members_count,
+                "description": description
+            }
             
-            logger.info(f"Found {len(similar_channels)} similar channels for {channel_username}")
-            return similar_channels
-        except errors.FloodWaitError as e:
+            similar_channels.append(channel_info)
+        
+        logger.info(f"Found {len(similar_channels)} similar channels for {channel_username}")
+        return similar_channels
+    
+    async def _fetch_failed(self, channel_username: str, error: Exception) -> None:
+        """Log a failed fetch, waiting out a flood wait if needed."""
+        if isinstance(error, errors.FloodWaitError):
             # Handle rate limiting
-            wait_time = e.seconds
+            wait_time = error.seconds
+            if self.rate_controller:
+                # The controller has already paused further calls to this method
+                logger.warning(f"Rate limited for {wait_time} seconds. Skipping {channel_username}")
+                return None
             logger.warning(f"Rate limited. Waiting for {wait_time} seconds")
             await asyncio.sleep(wait_time)
-            return []
+            return None
+        logger.error(f"Error fetching similar channels for {channel_username}: {error}")
+        return None
+    
+    async def _similar_channels_for_entity(self, channel_username: str,
+                                           input_channel: InputChannel) -> Optional[List[Dict[str, Any]]]:
+        """Fetch and collect recommendations for an already resolved channel."""
+        try:
+            # Use the GetChannelRecommendationsRequest to get similar channels
+            logger.info(f"Fetching recommendations for channel: {channel_username}")
+            result = await self._call(
+                'get_channel_recommendations', input_channel.channel_id,
+                lambda: self.client(GetChannelRecommendationsRequest(channel=input_channel))
+            )
+            return await self._collect_similar_channels(channel_username, result)
         except Exception as e:
-            logger.error(f"Error fetching similar channels for {channel_username}: {e}")
-            return []
-            
+            return await self._fetch_failed(channel_username, e)
+    
+    async def get_similar_channels(self, channel_username: str) -> Optional[List[Dict[str, Any]]]:
+        """Fetch similar channels for a given channel using Telegram's GetChannelRecommendationsRequest API.
+        
+        Returns None if the recommendations could not be fetched.
+        """
+        try:
+            # Try to resolve the entity first
+            input_channel = await self._resolve_channel(channel_username)
+        except Exception as e:
+            return await self._fetch_failed(channel_username, e)
+        if input_channel is None:
+            return None
+        return await self._similar_channels_for_entity(channel_username, input_channel)
+    
+    async def get_similar_channels_batch(self, channel_usernames: List[str]) -> Dict[str, Optional[List[Dict[str, Any]]]]:
+        """Fetch similar channels for several seeds with one recommendations round trip.
+        
+        Seeds are resolved one by one, then all recommendation requests go out
+        in a single container. A seed whose request failed with a non-permanent
+        error, or every seed if the container call itself fails, falls back to
+        a single request. Seeds that could not be fetched map to None.
+        """
+        similar = {}
+        resolved = []
+        for channel_username in channel_usernames:
+            try:
+                input_channel = await self._resolve_channel(channel_username)
+            except Exception as e:
+                similar[channel_username] = await self._fetch_failed(channel_username, e)
+                continue
+            if input_channel is None:
+                similar[channel_username] = None
+            else:
+                resolved.append((channel_username, input_channel))
+        
+        outcomes = [None] * len(resolved)
+        if len(resolved) > 1:
+            logger.info(f"Fetching recommendations for {len(resolved)} channels in one request")
+            try:
+                outcomes = await self._call_batch(
+                    'get_channel_recommendations',
+                    [input_channel.channel_id for _, input_channel in resolved],
+                    [GetChannelRecommendationsRequest(channel=input_channel) for _, input_channel in resolved]
+                )
+            except errors.FloodError as e:
+                outcomes = [e] * len(resolved)
+            except Exception as e:
+                logger.warning(f"Batched recommendations failed ({type(e).__name__}: {e}). "
+                               f"Falling back to single requests")
+        
+        # Flooded seeds are not retried one by one straight into the same flood
+        flood = None
+        flooded = []
+        for (channel_username, input_channel), outcome in zip(resolved, outcomes):
+            if isinstance(outcome, errors.FloodError):
+                similar[channel_username] = None
+                flooded.append(channel_username)
+                if flood is None or (getattr(outcome, 'seconds', 0) or 0) > (getattr(flood, 'seconds', 0) or 0):
+                    flood = outcome
+            elif outcome is None or (isinstance(outcome, Exception)
+                                     and not isinstance(outcome, self.PERMANENT_ERRORS)):
+                similar[channel_username] = await self._similar_channels_for_entity(channel_username, input_channel)
+            elif isinstance(outcome, Exception):
+                similar[channel_username] = await self._fetch_failed(channel_username, outcome)
+            else:
+                try:
+                    similar[channel_username] = await self._collect_similar_channels(channel_username, outcome)
+                except Exception as e:
+                    similar[channel_username] = await self._fetch_failed(channel_username, e)
+        if flood is not None:
+            await self._fetch_failed(", ".join(flooded), flood)
+        
+        return {channel_username: similar[channel_username] for channel_username in channel_usernames}
     
     async def close(self):
         """Close the Telegram client connection."""
         if self.client:
             await self.client.disconnect()
             logger.info("Disconnected from Telegram")
+        if self.cassette:
+            self.cassette.close()
+
+class ResultsStore:
+    """SQLite-backed store of discovered channels, used for server-side result queries."""
+
+    # Sort keys accepted by query(); each expression is backed by an index
+    SORT_EXPRESSIONS = {
+        'members': 'COALESCE(c.members, -1)',
+        'recommendations': 'c.rec_count',
+    }
+    # Result scopes accepted by query() and iter_export_rows()
+    SCOPES = ('all', 'last_run')
+
+    def __init__(self, db_path: str = None):
+        """Open (and create if needed) the results database."""
+        self.db_path = db_path or os.getenv('RESULTS_DB', os.path.join('data', 'crawler.db'))
+        db_dir = os.path.dirname(self.db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self._create_schema()
+
+    def _create_schema(self):
+        """Create tables and indexes if they do not exist yet."""
+        fts_exists = self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'channels_fts'"
+        ).fetchone() is not None
+        
+        with self.conn:
+            self.conn.executescript("""
+                CREATE TABLE IF NOT EXISTS channels (
+                    username TEXT PRIMARY KEY COLLATE NOCASE,
+                    title TEXT,
+                    url TEXT,
+                    members INTEGER,
+                    hop INTEGER NOT NULL DEFAULT 1,
+                    rec_count INTEGER NOT NULL DEFAULT 0,
+                    first_seen TEXT,
+                    last_seen TEXT,
+                    description TEXT,
+                    channel_id INTEGER
+                );
+                CREATE TABLE IF NOT EXISTS recommendations (
+                    source TEXT NOT NULL COLLATE NOCASE,
+                    username TEXT NOT NULL COLLATE NOCASE,
+                    hop INTEGER NOT NULL DEFAULT 1,
+                    seen_at TEXT,
+                    PRIMARY KEY (source, username)
+                ) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS idx_channels_members
+                    ON channels (COALESCE(members, -1) DESC, username);
+                CREATE INDEX IF NOT EXISTS idx_channels_rec_count
+                    ON channels (rec_count DESC, username);
+                CREATE INDEX IF NOT EXISTS idx_channels_hop_members
+                    ON channels (hop, COALESCE(members, -1) DESC, username);
+                CREATE INDEX IF NOT EXISTS idx_channels_hop_rec_count
+                    ON channels (hop, rec_count DESC, username);
+                CREATE INDEX IF NOT EXISTS idx_recommendations_username
+                    ON recommendations (username);
+                CREATE TABLE IF NOT EXISTS seed_stats (
+                    seed TEXT PRIMARY KEY COLLATE NOCASE,
+                    crawls INTEGER NOT NULL DEFAULT 0,
+                    last_crawled REAL,
+                    last_rec_count INTEGER NOT NULL DEFAULT 0,
+                    total_recs INTEGER NOT NULL DEFAULT 0,
+                    total_new INTEGER NOT NULL DEFAULT 0
+                );
+                CREATE TABLE IF NOT EXISTS last_run (
+                    id INTEGER PRIMARY KEY CHECK (id = 1),
+                    started TEXT NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS last_run_seeds (
+                    seed TEXT PRIMARY KEY COLLATE NOCASE
+                ) WITHOUT ROWID;
+                CREATE VIRTUAL TABLE IF NOT EXISTS channels_fts USING fts5 (
+                    username, title, description,
+                    tokenize = 'unicode61 remove_diacritics 2',
+                    prefix = '2 3 4'
+                );
+            """)
+            
+            # Databases created before descriptions were tracked lack the column
+            columns = {row['name'] for row in self.conn.execute("PRAGMA table_info(channels)")}
+            if 'description' not in columns:
+                self.conn.execute("ALTER TABLE channels ADD COLUMN description TEXT")
+            if 'channel_id' not in columns:
+                self.conn.execute("ALTER TABLE channels ADD COLUMN channel_id INTEGER")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_channels_channel_id ON channels (channel_id)")
+            
+            # Strip the @ from sources stored before they were normalized; the
+            # range ('@', '[') only matches @-prefixed names under NOCASE and uses the key
+            self.conn.execute("""
+                UPDATE OR IGNORE recommendations SET source = substr(source, 2)
+                WHERE source >= '@' AND source < '['
+            """)
+            self.conn.execute("DELETE FROM recommendations WHERE source >= '@' AND source < '['")
+            
+            # Index channels stored before the search index existed
+            if not fts_exists:
+                self.conn.execute("""
+                    INSERT INTO channels_fts (rowid, username, title, description)
+                    SELECT rowid, username, title, description FROM channels
+                """)
+
+    def start_run(self, seeds: List[str]):
+        """Remember the seeds and start time of the crawl that is starting, replacing the previous run."""
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO last_run (id, started) VALUES (1, ?)",
+                              (datetime.now().isoformat(),))
+            self.conn.execute("DELETE FROM last_run_seeds")
+            self.conn.executemany("INSERT OR IGNORE INTO last_run_seeds (seed) VALUES (?)",
+                                  ((seed.lstrip('@'),) for seed in seeds))
+
+    def _scope_clause(self, scope: str) -> Tuple[str, List[Any]]:
+        """SQL condition on recommendations r limiting them to a scope, with its parameters."""
+        if scope not in self.SCOPES:
+            raise ValueError(f"Unsupported scope: {scope}")
+        if scope == 'last_run':
+            run = self.conn.execute("SELECT started FROM last_run WHERE id = 1").fetchone()
+            # Stores without a recorded run fall back to everything
+            if run is not None:
+                return "r.source IN (SELECT seed FROM last_run_seeds) AND r.seen_at >= ?", [run['started']]
+        return "", []
 
-async def process_channels(input_channels: List[str], config: Dict[str, Any]) -> Dict[str, Any]:
-    """Main process to fetch similar channels with CSV export capability."""
+    def add_recommendations(self, source: str, channels: List[Dict[str, Any]], hop: int = 1) -> int:
+        """Upsert the channels recommended for a source seed in a single transaction.
+        
+        Returns the number of channels that had never been seen before.
+        """
+        source = source.lstrip('@')
+        new_channels = 0
+        with self.conn:
+            for info in channels:
+                seen_at = info.get('timestamp') or datetime.now().isoformat()
+                row = self.conn.execute("""
+                    INSERT INTO channels (username, title, url, members, hop, first_seen, last_seen, description,
+                                          channel_id)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (username) DO UPDATE SET
+                        title = excluded.title,
+                        url = excluded.url,
+                        members = COALESCE(excluded.members, channels.members),
+                        hop = MIN(channels.hop, excluded.hop),
+                        last_seen = excluded.last_seen,
+                        description = COALESCE(excluded.description, channels.description),
+                        channel_id = COALESCE(excluded.channel_id, channels.channel_id)
+                    RETURNING rowid, username, title, description, rec_count
+                """, (info['username'], info.get('title'), info.get('url'), info.get('members'),
+                      hop, seen_at, seen_at, info.get('description'), info.get('id'))).fetchone()
+                
+                # Every stored channel has at least one recommendation, so a zero count means new
+                if row['rec_count'] == 0:
+                    new_channels += 1
+                
+                # Keep the search index in step with the channel row
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO channels_fts (rowid, username, title, description) VALUES (?, ?, ?, ?)",
+                    (row['rowid'], row['username'], row['title'], row['description'])
+                )
+
+                cursor = self.conn.execute(
+                    "INSERT OR IGNORE INTO recommendations (source, username, hop, seen_at) VALUES (?, ?, ?, ?)",
+                    (source, info['username'], hop, seen_at)
+                )
+                if cursor.rowcount:
+                    self.conn.execute(
+                        "UPDATE channels SET rec_count = rec_count + 1 WHERE username = ?",
+                        (info['username'],)
+                    )
+                else:
+                    self.conn.execute(
+                        "UPDATE recommendations SET seen_at = ? WHERE source = ? AND username = ?",
+                        (seen_at, source, info['username'])
+                    )
+        return new_channels
+
+    def record_seed_crawl(self, seed: str, rec_count: int, new_count: int):
+        """Update the per-seed crawl history used for scheduling."""
+        with self.conn:
+            self.conn.execute("""
+                INSERT INTO seed_stats (seed, crawls, last_crawled, last_rec_count, total_recs, total_new)
+                VALUES (?, 1, ?, ?, ?, ?)
+                ON CONFLICT (seed) DO UPDATE SET
+                    crawls = seed_stats.crawls + 1,
+                    last_crawled = excluded.last_crawled,
+                    last_rec_count = excluded.last_rec_count,
+                    total_recs = seed_stats.total_recs + excluded.total_recs,
+                    total_new = seed_stats.total_new + excluded.total_new
+            """, (seed.lstrip('@'), time.time(), rec_count, rec_count, new_count))
+
+    def seed_stats(self, seeds: List[str]) -> Dict[str, sqlite3.Row]:
+        """Return crawl history rows keyed by lower-cased seed."""
+        stats = {}
+        seeds = [seed.lstrip('@') for seed in seeds]
+        # Chunked to stay under SQLite's bound-parameter limit
+        for start in range(0, len(seeds), 500):
+            chunk = seeds[start:start + 500]
+            placeholders = ", ".join("?" for _ in chunk)
+            rows = self.conn.execute(
+                f"SELECT * FROM seed_stats WHERE seed IN ({placeholders})", chunk
+            )
+            for row in rows:
+                stats[row['seed'].lower()] = row
+        return stats
+
+    @staticmethod
+    def encode_cursor(sort_key: Any, username: str) -> str:
+        """Encode the last row of a page as an opaque cursor."""
+        raw = json.dumps([sort_key, username]).encode('utf-8')
+        return base64.urlsafe_b64encode(raw).decode('ascii')
+
+    @staticmethod
+    def decode_cursor(cursor: str) -> Tuple[Any, str]:
+        """Decode a cursor produced by encode_cursor()."""
+        try:
+            sort_key, username = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+            return sort_key, username
+        except Exception:
+            raise ValueError("Invalid cursor")
+
+    def query(self, source: str = None, min_members: int = None, prefix: str = None,
+              hop: int = None, sort: str = 'members', limit: int = 50, offset: int = 0,
+              cursor: str = None, scope: str = 'all') -> Dict[str, Any]:
+        """Return one page of discovered channels matching the given filters.
+        
+        scope='last_run' limits the results to what the most recent crawl recommended.
+        """
+        if sort not in self.SORT_EXPRESSIONS:
+            raise ValueError(f"Unsupported sort key: {sort}")
+        sort_expr = self.SORT_EXPRESSIONS[sort]
+
+        clauses = []
+        params = []
+        scope_clause, scope_params = self._scope_clause(scope)
+        if scope_clause:
+            clauses.append(f"c.username IN (SELECT r.username FROM recommendations r WHERE {scope_clause})")
+            params.extend(scope_params)
+        if source:
+            clauses.append("c.username IN (SELECT username FROM recommendations WHERE source = ?)")
+            params.append(source.lstrip('@'))
+        if min_members is not None:
+            clauses.append("c.members >= ?")
+            params.append(min_members)
+        if prefix:
+            # Range scan on the NOCASE primary key instead of LIKE ('_' is a wildcard there)
+            prefix = prefix.lstrip('@')
+            clauses.append("c.username >= ? AND c.username < ?")
+            params.extend([prefix, prefix + '\uffff'])
+        if hop is not None:
+            clauses.append("c.hop = ?")
+            params.append(hop)
+        if cursor:
+            last_key, last_username = self.decode_cursor(cursor)
+            clauses.append(f"({sort_expr} < ? OR ({sort_expr} = ? AND c.username > ?))")
+            params.extend([last_key, last_key, last_username])
+            offset = 0
+
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        sql = f"""
+            SELECT c.username, c.title, c.url, c.members, c.hop, c.rec_count, c.last_seen,
+                   {sort_expr} AS sort_key
+            FROM channels c
+            {where}
+            ORDER BY {sort_expr} DESC, c.username ASC
+            LIMIT ? OFFSET ?
+        """
+        rows = self.conn.execute(sql, params + [limit + 1, offset]).fetchall()
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        items = [
+            {
+                "username": row["username"],
+                "title": row["title"],
+                "url": row["url"],
+                "members": row["members"],
+                "hop": row["hop"],
+                "recommendations": row["rec_count"],
+                "last_seen": row["last_seen"],
+            }
+            for row in rows
+        ]
+
+        next_cursor = None
+        if has_more and rows:
+            next_cursor = self.encode_cursor(rows[-1]["sort_key"], rows[-1]["username"])
+
+        return {
+            "items": items,
+            "count": len(items),
+            "has_more": has_more,
+            "next_cursor": next_cursor,
+        }
+
+    @staticmethod
+    def build_match_query(text: str) -> str:
+        """Turn free text into an FTS5 query with prefix matching on every term."""
+        terms = re.findall(r"\w+", text.lower())
+        return " ".join(f'"{term}"*' for term in terms)
+
+    def search(self, text: str, limit: int = 20) -> List[Dict[str, Any]]:
+        """Full-text search over usernames, titles and descriptions, best matches first."""
+        match_query = self.build_match_query(text)
+        if not match_query:
+            return []
+        
+        # bm25 weights: username and title matches outrank description matches
+        rows = self.conn.execute("""
+            SELECT c.username, c.title, c.url, c.members, c.rec_count, c.description,
+                   bm25(channels_fts, 10.0, 5.0, 1.0) AS rank
+            FROM channels_fts
+            JOIN channels c ON c.rowid = channels_fts.rowid
+            WHERE channels_fts MATCH ?
+            ORDER BY rank
+            LIMIT ?
+        """, (match_query, limit)).fetchall()
+        
+        return [
+            {
+                "username": row["username"],
+                "title": row["title"],
+                "url": row["url"],
+                "members": row["members"],
+                "recommendations": row["rec_count"],
+                "description": row["description"],
+                "score": round(-row["rank"], 4),
+            }
+            for row in rows
+        ]
+
+    def iter_export_rows(self, scope: str = 'all'):
+        """Yield (source, title, username, url, members) rows for CSV export."""
+        scope_clause, scope_params = self._scope_clause(scope)
+        where = f"WHERE {scope_clause}" if scope_clause else ""
+        cursor = self.conn.execute(f"""
+            SELECT r.source, c.title, c.username, c.url, c.members
+            FROM recommendations r
+            JOIN channels c ON c.username = r.username
+            {where}
+            ORDER BY r.source, c.username
+        """, scope_params)
+        for row in cursor:
+            yield tuple(row)
+
+    def recommendations_for(self, source: str) -> List[str]:
+        """Return the usernames previously recommended for a source seed."""
+        rows = self.conn.execute(
+            "SELECT username FROM recommendations WHERE source = ?", (source.lstrip('@'),)
+        )
+        return [row[0] for row in rows]
+
+    def usernames_for_ids(self, channel_ids: List[int]) -> Dict[int, str]:
+        """Map Telegram channel ids to stored usernames."""
+        usernames = {}
+        channel_ids = [int(channel_id) for channel_id in channel_ids]
+        for start in range(0, len(channel_ids), 500):
+            chunk = channel_ids[start:start + 500]
+            placeholders = ", ".join("?" for _ in chunk)
+            rows = self.conn.execute(
+                f"SELECT channel_id, username FROM channels WHERE channel_id IN ({placeholders})", chunk
+            )
+            usernames.update((row[0], row[1]) for row in rows)
+        return usernames
+
+    def recommendation_counts(self, sources: List[str]) -> Dict[str, int]:
+        """Return the number of stored recommendations keyed by lower-cased source."""
+        counts = {}
+        sources = [source.lstrip('@') for source in sources]
+        for start in range(0, len(sources), 500):
+            chunk = sources[start:start + 500]
+            placeholders = ", ".join("?" for _ in chunk)
+            rows = self.conn.execute(
+                f"SELECT source, COUNT(*) FROM recommendations WHERE source IN ({placeholders}) GROUP BY source",
+                chunk
+            )
+            counts.update((row[0].lower(), row[1]) for row in rows)
+        return counts
+
+    def known_usernames(self, usernames: List[str]) -> set:
+        """Return the lower-cased usernames that are already stored as discovered channels."""
+        known = set()
+        usernames = [username.lstrip('@') for username in usernames]
+        for start in range(0, len(usernames), 500):
+            chunk = usernames[start:start + 500]
+            placeholders = ", ".join("?" for _ in chunk)
+            rows = self.conn.execute(f"SELECT username FROM channels WHERE username IN ({placeholders})", chunk)
+            known.update(row[0].lower() for row in rows)
+        return known
+
+    def average_fan_out(self) -> Optional[float]:
+        """Average recommendations per crawl over all seeds, or None without any history."""
+        total_recs, crawls = self.conn.execute("SELECT SUM(total_recs), SUM(crawls) FROM seed_stats").fetchone()
+        if crawls:
+            return total_recs / crawls
+        # Stores filled before crawl history was tracked only have the recommendations
+        total_recs, sources = self.conn.execute(
+            "SELECT COUNT(*), COUNT(DISTINCT source) FROM recommendations"
+        ).fetchone()
+        return total_recs / sources if sources else None
+
+    def has_results(self) -> bool:
+        """Return True if at least one channel has been stored."""
+        return self.conn.execute("SELECT 1 FROM channels LIMIT 1").fetchone() is not None
+
+    def close(self):
+        """Close the database connection."""
+        self.conn.close()
+
+class MemberHistory:
+    """Append-only columnar time series of channel member counts.
+    
+    Observations are stored as three parallel little-endian arrays per
+    segment directory: channel ids (int64), unix timestamps (uint32) and
+    member counts (int32), 16 bytes per observation. New observations are
+    appended to the newest segment. Once there are more than `max_segments`
+    segments they are compacted into one, sorted by channel and time.
+    
+    Writers (append, compact) hold an exclusive lock on the history directory
+    and readers a shared one, so several processes can use the same history.
+    """
+    
+    COLUMNS = (('ids', '<i8'), ('ts', '<u4'), ('members', '<i4'))
+    
+    def __init__(self, path: str = None, segment_rows: int = 200000, max_segments: int = 8):
+        """Open (and create if needed) the history directory."""
+        self.path = path or os.getenv('MEMBER_HISTORY_DIR', os.path.join('data', 'members'))
+        self.segment_rows = segment_rows
+        self.max_segments = max_segments
+        os.makedirs(self.path, exist_ok=True)
+    
+    @contextmanager
+    def _locked(self, exclusive: bool = True):
+        """Hold the history lock file for the duration of the block."""
+        with open(os.path.join(self.path, '.lock'), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+    
+    def _segments(self) -> List[str]:
+        """Segment directories, oldest first."""
+        names = sorted(name for name in os.listdir(self.path) if name.startswith('seg_'))
+        return [os.path.join(self.path, name) for name in names]
+    
+    def _new_segment(self) -> str:
+        """Create the next segment directory and return its path."""
+        segments = self._segments()
+        number = int(os.path.basename(segments[-1])[4:]) + 1 if segments else 0
+        segment = os.path.join(self.path, f"seg_{number:06d}")
+        os.makedirs(segment)
+        return segment
+    
+    @classmethod
+    def _read_segment(cls, segment: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Load one segment's columns, trimmed to the shortest in case a write was cut off."""
+        columns = []
+        for name, dtype in cls.COLUMNS:
+            column_file = os.path.join(segment, name)
+            columns.append(np.fromfile(column_file, dtype=dtype) if os.path.exists(column_file)
+                           else np.empty(0, dtype=dtype))
+        rows = min(len(column) for column in columns)
+        return tuple(column[:rows] for column in columns)
+    
+    @classmethod
+    def _repair_segment(cls, segment: str):
+        """Truncate the columns of a segment to their common length after a cut-off write."""
+        lengths = {}
+        for name, dtype in cls.COLUMNS:
+            column_file = os.path.join(segment, name)
+            lengths[name] = os.path.getsize(column_file) // np.dtype(dtype).itemsize if os.path.exists(column_file) else 0
+        rows = min(lengths.values())
+        for name, dtype in cls.COLUMNS:
+            column_file = os.path.join(segment, name)
+            if os.path.exists(column_file) and os.path.getsize(column_file) != rows * np.dtype(dtype).itemsize:
+                logger.warning(f"Truncating torn member history column {column_file} to {rows} rows")
+                os.truncate(column_file, rows * np.dtype(dtype).itemsize)
+    
+    @classmethod
+    def _write_columns(cls, segment: str, ids: np.ndarray, ts: np.ndarray, members: np.ndarray, mode: str = 'ab'):
+        """Write or append columns to a segment."""
+        for (name, dtype), values in zip(cls.COLUMNS, (ids, ts, members)):
+            with open(os.path.join(segment, name), mode) as f:
+                np.asarray(values, dtype=dtype).tofile(f)
+    
+    def append(self, observations: List[Tuple[int, int]], timestamp: float = None):
+        """Append (channel_id, members) observations taken at one point in time."""
+        if not observations:
+            return
+        ids = np.fromiter((channel_id for channel_id, _ in observations), dtype='<i8', count=len(observations))
+        members = np.fromiter((count for _, count in observations), dtype='<i4', count=len(observations))
+        ts = np.full(len(observations), int(timestamp or time.time()), dtype='<u4')
+        
+        with self._locked():
+            segments = self._segments()
+            segment = segments[-1] if segments else self._new_segment()
+            # Realign the columns first so a previously cut-off append cannot shift new rows
+            self._repair_segment(segment)
+            ids_file = os.path.join(segment, 'ids')
+            if os.path.exists(ids_file) and os.path.getsize(ids_file) // 8 >= self.segment_rows:
+                segment = self._new_segment()
+            self._write_columns(segment, ids, ts, members)
+            
+            if len(self._segments()) > self.max_segments:
+                self._compact()
+    
+    def load(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Load every observation as (ids, ts, members) arrays."""
+        with self._locked(exclusive=False):
+            return self._load()
+    
+    def _load(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Load every observation; the caller holds the lock."""
+        parts = [self._read_segment(segment) for segment in self._segments()]
+        if not parts:
+            return tuple(np.empty(0, dtype=dtype) for _, dtype in self.COLUMNS)
+        return tuple(np.concatenate([part[i] for part in parts]) for i in range(len(self.COLUMNS)))
+    
+    def compact(self):
+        """Merge all segments into one, sorted by channel and time, dropping duplicate observations."""
+        with self._locked():
+            self._compact()
+    
+    def _compact(self):
+        """Compact the segments; the caller holds the lock."""
+        segments = self._segments()
+        if len(segments) <= 1:
+            return
+        ids, ts, members = self._load()
+        order = np.lexsort((ts, ids))
+        ids, ts, members = ids[order], ts[order], members[order]
+        keep = np.ones(len(ids), dtype=bool)
+        keep[1:] = (ids[1:] != ids[:-1]) | (ts[1:] != ts[:-1])
+        
+        # Write the merged segment next to the old ones, then swap it in
+        merged = self._new_segment()
+        self._write_columns(merged, ids[keep], ts[keep], members[keep], mode='wb')
+        for segment in segments:
+            for name, _ in self.COLUMNS:
+                column_file = os.path.join(segment, name)
+                if os.path.exists(column_file):
+                    os.remove(column_file)
+            os.rmdir(segment)
+        logger.info(f"Compacted {len(segments)} member history segments into {int(keep.sum())} observations")
+    
+    def growth(self, days: float, now: float = None) -> Dict[str, np.ndarray]:
+        """Per-channel growth between the first and last observation within the last `days` days."""
+        ids, ts, members = self.load()
+        window = ts >= (now or time.time()) - days * 86400
+        ids, ts, members = ids[window], ts[window], members[window]
+        
+        order = np.lexsort((ts, ids))
+        ids, members = ids[order], members[order].astype(np.int64)
+        channel_ids, first, counts = np.unique(ids, return_index=True, return_counts=True)
+        last = first + counts - 1
+        start, end = members[first], members[last]
+        absolute = end - start
+        relative = np.divide(absolute, start, out=np.zeros(len(start), dtype=float), where=start > 0)
+        return {
+            "channel_ids": channel_ids,
+            "start": start,
+            "end": end,
+            "absolute": absolute,
+            "relative": relative,
+            "observations": counts,
+        }
+    
+    def top_movers(self, days: float, limit: int = 10, by: str = 'absolute',
+                   min_observations: int = 2) -> List[Dict[str, Any]]:
+        """Channels with the largest growth over the last `days` days."""
+        if by not in ('absolute', 'relative'):
+            raise ValueError(f"Unsupported growth measure: {by}")
+        stats = self.growth(days)
+        eligible = np.flatnonzero(stats["observations"] >= min_observations)
+        ranked = eligible[np.argsort(-stats[by][eligible], kind='stable')][:limit]
+        return [
+            {
+                "channel_id": int(stats["channel_ids"][i]),
+                "start": int(stats["start"][i]),
+                "end": int(stats["end"][i]),
+                "growth": int(stats["absolute"][i]),
+                "growth_rate": round(float(stats["relative"][i]), 4),
+                "observations": int(stats["observations"][i]),
+            }
+            for i in ranked
+        ]
+
+class SeedClusterer:
+    """Clusters seeds by MinHash/LSH over their recommendation sets.
+    
+    Seeds whose neighbourhoods overlap above `threshold` (estimated Jaccard
+    similarity) end up in the same cluster. An unprocessed seed whose
+    recommendation set from a previous run matches a seed already crawled in
+    this run is skipped or moved to the back of the queue, depending on `mode`.
+    """
+    
+    # Largest 32-bit prime; keeps a * x + b inside uint64 for 32-bit a, b and x
+    _PRIME = np.uint64(4294967291)
+    MODES = ('skip', 'deprioritize')
+    
+    def __init__(self, threshold: float = 0.8, mode: str = 'skip', num_perm: int = 128,
+                 bands: int = 32, seed: int = 1):
+        """Set up the hash permutations and empty LSH buckets."""
+        if mode not in self.MODES:
+            raise ValueError(f"Unsupported clustering mode: {mode}")
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+        
+        self.threshold = threshold
+        self.mode = mode
+        self.bands = bands
+        self.rows = num_perm // bands
+        
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, int(self._PRIME), size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, int(self._PRIME), size=num_perm, dtype=np.uint64)
+        
+        self._signatures = {}  # processed seed -> signature
+        self._buckets = {}  # (band, band bytes) -> processed seeds
+        self._parent = {}  # union-find over processed seeds
+        self._skipped = {}  # seed -> representative of the matching cluster
+        self._deferred = {}
+    
+    def signature(self, usernames: List[str]) -> Optional[np.ndarray]:
+        """Compute the MinHash signature of a set of usernames."""
+        hashes = {zlib.crc32(username.lower().encode('utf-8')) for username in usernames}
+        if not hashes:
+            return None
+        values = np.fromiter(hashes, dtype=np.uint64, count=len(hashes))
+        # One row per username, one column per permutation; min over usernames
+        permuted = (np.outer(values, self._a) + self._b) % self._PRIME
+        return permuted.min(axis=0)
+    
+    def _band_keys(self, signature: np.ndarray):
+        """Yield the LSH bucket key for each band of a signature."""
+        for band in range(self.bands):
+            yield band, signature[band * self.rows:(band + 1) * self.rows].tobytes()
+    
+    def _find(self, seed: str) -> str:
+        """Return the representative seed of a cluster."""
+        root = seed
+        while self._parent[root] != root:
+            root = self._parent[root]
+        while self._parent[seed] != root:
+            self._parent[seed], seed = root, self._parent[seed]
+        return root
+    
+    def _candidates(self, signature: np.ndarray) -> List[Tuple[str, float]]:
+        """Return processed seeds sharing a band with the signature and similar enough."""
+        seen = set()
+        matches = []
+        for key in self._band_keys(signature):
+            for other in self._buckets.get(key, ()):
+                if other in seen:
+                    continue
+                seen.add(other)
+                similarity = float(np.mean(self._signatures[other] == signature))
+                if similarity >= self.threshold:
+                    matches.append((other, similarity))
+        return sorted(matches, key=lambda match: match[1], reverse=True)
+    
+    def add(self, seed: str, usernames: List[str]):
+        """Record a processed seed's recommendation set and merge it into matching clusters."""
+        signature = self.signature(usernames)
+        if signature is None:
+            return
+        
+        self._parent.setdefault(seed, seed)
+        for other, _ in self._candidates(signature):
+            root, other_root = self._find(seed), self._find(other)
+            if root != other_root:
+                self._parent[other_root] = root
+        
+        self._signatures[seed] = signature
+        for key in self._band_keys(signature):
+            self._buckets.setdefault(key, []).append(seed)
+    
+    def match(self, seed: str, known_usernames: List[str]) -> Optional[Tuple[str, float]]:
+        """Return (representative, similarity) if a seed's known neighbourhood is already covered."""
+        if seed in self._signatures:
+            return None
+        signature = self.signature(known_usernames)
+        if signature is None:
+            return None
+        candidates = self._candidates(signature)
+        if not candidates:
+            return None
+        other, similarity = candidates[0]
+        return self._find(other), similarity
+    
+    def record_skip(self, seed: str, representative: str):
+        """Remember that a seed was skipped in favour of a cluster."""
+        self._skipped[seed] = representative
+    
+    def record_deferral(self, seed: str, representative: str):
+        """Remember that a seed was moved to the back of the queue."""
+        self._deferred[seed] = representative
+    
+    def report(self) -> List[Dict[str, Any]]:
+        """Summarize each cluster: crawled seeds and the seeds skipped or deferred for it."""
+        clusters = {}
+        for seed in self._signatures:
+            root = self._find(seed)
+            clusters.setdefault(root, {"representative": root, "seeds": [], "skipped": [], "deferred": []})
+            clusters[root]["seeds"].append(seed)
+        for key, decisions in (("skipped", self._skipped), ("deferred", self._deferred)):
+            for seed, representative in decisions.items():
+                root = self._find(representative)
+                clusters[root][key].append(seed)
+        
+        # Singletons with nothing skipped are not interesting
+        report = [
+            cluster for cluster in clusters.values()
+            if len(cluster["seeds"]) > 1 or cluster["skipped"] or cluster["deferred"]
+        ]
+        return sorted(report, key=lambda cluster: len(cluster["seeds"]) + len(cluster["skipped"]), reverse=True)
+
+class SeedScheduler:
+    """Orders seeds by expected yield and enforces a run budget.
+    
+    Expected yield is the seed's average recommendation count times its
+    (smoothed) share of never-seen channels, scaled down for seeds crawled
+    recently. Seeds without history get the average yield of the crawled ones
+    with a new-channel rate of 1, so unexplored seeds go first.
+    """
+    
+    def __init__(self, max_runtime: Optional[float] = None, max_api_calls: Optional[int] = None,
+                 staleness_days: float = 7.0):
+        """Set the budget; the clock starts now."""
+        self.max_runtime = max_runtime
+        self.max_api_calls = max_api_calls
+        self.staleness_days = staleness_days
+        self.started = time.monotonic()
+    
+    def expected_yield(self, stats: Optional[sqlite3.Row], default_recs: float) -> float:
+        """Estimate how many new channels crawling a seed would discover."""
+        if stats is None or not stats['crawls']:
+            return default_recs
+        avg_recs = stats['total_recs'] / stats['crawls']
+        new_rate = (stats['total_new'] + 1) / (stats['total_recs'] + 2)
+        days_since = (time.time() - (stats['last_crawled'] or 0)) / 86400
+        staleness = min(1.0, days_since / self.staleness_days)
+        return avg_recs * new_rate * staleness
+    
+    def order(self, seeds: List[str], store: 'ResultsStore') -> List[str]:
+        """Return seeds sorted by expected yield, highest first (file order breaks ties)."""
+        history = store.seed_stats(seeds)
+        crawled = [row for row in history.values() if row['crawls']]
+        default_recs = (sum(row['total_recs'] / row['crawls'] for row in crawled) / len(crawled)
+                        if crawled else 1.0)
+        
+        scores = {seed: self.expected_yield(history.get(seed.lstrip('@').lower()), default_recs)
+                  for seed in seeds}
+        ordered = sorted(seeds, key=lambda seed: scores[seed], reverse=True)
+        logger.info(f"Prioritized {len(seeds)} seeds ({len(history)} with crawl history)")
+        return ordered
+    
+    def elapsed(self) -> float:
+        """Seconds since the scheduler was created."""
+        return time.monotonic() - self.started
+    
+    def exhausted(self, api_calls: int) -> Optional[str]:
+        """Return the reason the budget is used up, or None if there is budget left."""
+        if self.max_runtime is not None and self.elapsed() >= self.max_runtime:
+            return f"max runtime of {self.max_runtime}s reached"
+        if self.max_api_calls is not None and api_calls >= self.max_api_calls:
+            return f"max API calls of {self.max_api_calls} reached"
+        return None
+
+class CrawlPlanner:
+    """Dry-run estimate of the API calls and runtime of a crawl, without network access.
+    
+    Seeds are streamed through validation and deduplication and looked up in
+    chunks against the Telegram session's entity cache and the results store.
+    Every seed needs one resolve and one recommendations call, and each
+    recommended channel needs one enrichment (GetFullChannel) call, estimated
+    from the seed's own crawl history or else the average fan-out of all
+    crawled seeds. The entity cache count is informational only: usernames are
+    always resolved over the network.
+    """
+    
+    CHUNK_SIZE = 500
+    DEFAULT_FAN_OUT = 10.0  # Recommendations per seed when there is no history at all
+    CALL_LATENCY = 0.3  # Assumed seconds per round trip
+    
+    def __init__(self, config: Dict[str, Any]):
+        """Plan against the settings returned by load_config()."""
+        self.config = config
+    
+    def cached_channel_usernames(self) -> set:
+        """Lower-cased usernames of the channels in the session's entity cache."""
+        session_file = self.config.get('telegram_session') or 'crawler'
+        if not session_file.endswith('.session'):
+            session_file += '.session'
+        if not os.path.exists(session_file):
+            return set()
+        
+        try:
+            conn = sqlite3.connect(f"file:{os.path.abspath(session_file)}?mode=ro", uri=True)
+            try:
+                # Channel ids are stored marked, i.e. -100 followed by the id
+                rows = conn.execute(
+                    "SELECT username FROM entities WHERE username IS NOT NULL AND id <= ?", (-10 ** 12,)
+                )
+                return {row[0].lower() for row in rows}
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            logger.warning(f"Could not read the entity cache in {session_file}: {e}")
+            return set()
+    
+    def _scan_chunk(self, store: 'ResultsStore', chunk: List[str], cached_usernames: set,
+                    seeds: Dict[str, int], default_fan_out: float) -> float:
+        """Count a chunk of normalized seeds and return their expected enrichment calls."""
+        history = store.seed_stats(chunk)
+        stored = store.recommendation_counts(chunk)
+        seeds['known_channels'] += len(store.known_usernames(chunk))
+        
+        expected = 0.0
+        for seed in chunk:
+            if seed in cached_usernames:
+                seeds['cached_entities'] += 1
+            stats = history.get(seed)
+            if stats is not None and stats['crawls']:
+                seeds['crawled_before'] += 1
+                expected += stats['total_recs'] / stats['crawls']
+            elif seed in stored:
+                seeds['crawled_before'] += 1
+                expected += stored[seed]
+            else:
+                expected += default_fan_out
+        return expected
+    
+    def project_runtime(self, calls: Dict[str, int], unique_seeds: int) -> Dict[str, Any]:
+        """Project the runtime of the given calls from the configured pacing and batching."""
+        batch_size = max(1, self.config.get('recommendation_batch_size', 1))
+        batches = -(-unique_seeds // batch_size)
+        round_trips = calls['get_entity'] + batches + calls['get_full_channel']
+        latency_seconds = round_trips * self.CALL_LATENCY
+        
+        projection = {"batch_size": batch_size, "round_trips": round_trips}
+        if self.config.get('adaptive_rate', True):
+            # Each method is paced on its own, so the slowest method bounds the run
+            rate_controller = RateController.from_config(self.config)
+            rates = {method: rate_controller.rate(method) for method in calls}
+            pacing = {method: rate_controller.pacing_seconds(method, calls[method]) for method in calls}
+            projection.update(rates={method: round(rate, 4) for method, rate in rates.items()},
+                              pacing_seconds={method: round(seconds, 1) for method, seconds in pacing.items()})
+            runtime = max(max(pacing.values()), latency_seconds)
+        else:
+            delay = self.config.get('delay_between_channels', 8)
+            projection["delay_between_batches"] = delay
+            runtime = latency_seconds + max(batches - 1, 0) * delay
+        projection["runtime_seconds"] = round(runtime, 1)
+        return projection
+    
+    def plan(self, seeds: Iterable[Any]) -> Dict[str, Any]:
+        """Stream the seeds and return the estimated calls, runtime and budget fit."""
+        started = time.monotonic()
+        cached_usernames = self.cached_channel_usernames()
+        counts = {"input": 0, "invalid": 0, "duplicates": 0, "unique": 0,
+                  "cached_entities": 0, "crawled_before": 0, "known_channels": 0}
+        
+        store = ResultsStore(self.config.get('results_db'))
+        try:
+            average_fan_out = store.average_fan_out()
+            default_fan_out = average_fan_out if average_fan_out is not None else self.DEFAULT_FAN_OUT
+            
+            seen = set()
+            chunk = []
+            enrich_calls = 0.0
+            for seed in seeds:
+                counts["input"] += 1
+                channel = InputHandler.normalize_channel(seed)
+                if channel is None:
+                    counts["invalid"] += 1
+                    continue
+                key = channel.lower()
+                if key in seen:
+                    counts["duplicates"] += 1
+                    continue
+                seen.add(key)
+                chunk.append(key)
+                if len(chunk) == self.CHUNK_SIZE:
+                    enrich_calls += self._scan_chunk(store, chunk, cached_usernames, counts, default_fan_out)
+                    chunk = []
+            if chunk:
+                enrich_calls += self._scan_chunk(store, chunk, cached_usernames, counts, default_fan_out)
+            counts["unique"] = len(seen)
+        finally:
+            store.close()
+        
+        calls = {
+            "get_entity": counts["unique"],
+            "get_channel_recommendations": counts["unique"],
+            "get_full_channel": int(round(enrich_calls)),
+        }
+        total_calls = sum(calls.values())
+        projection = self.project_runtime(calls, counts["unique"])
+        
+        plan = {
+            "seeds": counts,
+            "fan_out": {
+                "average": round(default_fan_out, 2),
+                "source": "history" if average_fan_out is not None else "default",
+            },
+            "calls": calls,
+            "total_calls": total_calls,
+            **projection,
+        }
+        
+        # How much of the input fits the configured budget
+        max_runtime = self.config.get('max_runtime')
+        max_api_calls = self.config.get('max_api_calls')
+        if max_runtime is not None or max_api_calls is not None:
+            share = 1.0
+            if max_runtime is not None and projection["runtime_seconds"]:
+                share = min(share, max_runtime / projection["runtime_seconds"])
+            if max_api_calls is not None and total_calls:
+                share = min(share, max_api_calls / total_calls)
+            plan["budget"] = {
+                "max_runtime": max_runtime,
+                "max_api_calls": max_api_calls,
+                "fits": share >= 1.0,
+                "seeds_within_budget": int(counts["unique"] * share),
+            }
+        
+        plan["plan_seconds"] = round(time.monotonic() - started, 3)
+        return plan
+
+async def process_channels(input_channels: List[str], config: Dict[str, Any],
+                           crawler: Optional[TelegramCrawler] = None) -> Dict[str, Any]:
+    """Main process to fetch similar channels with CSV export capability.
+
+    If a connected crawler is passed in it is borrowed for this run and left
+    open afterwards; otherwise a crawler is created and closed here.
+    """
     logger.info("PROCESS_CHANNELS STARTED")
     # Initialize handlers
-    telegram_crawler = TelegramCrawler(
-        api_id=config['telegram_api_id'],
-        api_hash=config['telegram_api_hash'],
-        phone=config.get('telegram_phone'),
-        session_name=config.get('telegram_session', 'crawler')
-    )
+    owns_crawler = crawler is None
+    cassette = None
+    if owns_crawler and config.get('replay_cassette'):
+        cassette = Cassette(config['replay_cassette'], 'replay', config.get('replay_latency', 'zero'))
+    elif owns_crawler and config.get('record_cassette'):
+        cassette = Cassette(config['record_cassette'], 'record')
+    telegram_crawler = crawler or TelegramCrawler.from_config(config, cassette=cassette)
+
+    # Replays run against a throwaway store and history so they stay reproducible
+    # and leave the real results, member history and learned rates untouched
+    replaying = bool(cassette and cassette.replaying)
+    scratch_dir = tempfile.mkdtemp(prefix='crawler_replay_') if replaying else None
+    if replaying:
+        logger.info(f"Replaying into scratch storage at {scratch_dir}")
+        results_store = ResultsStore(os.path.join(scratch_dir, 'crawler.db'))
+        member_history = MemberHistory(os.path.join(scratch_dir, 'members'))
+    else:
+        results_store = ResultsStore(config.get('results_db'))
+        member_history = MemberHistory(config.get('member_history_dir'))
     
-    # Connect to Telegram
-    if not await telegram_crawler.connect():
+    # Optional MinHash/LSH stage that skips or defers near-duplicate seeds
+    clusterer = None
+    if config.get('seed_clustering'):
+        clusterer = SeedClusterer(
+            threshold=config.get('seed_cluster_threshold', 0.8),
+            mode=config['seed_clustering']
+        )
+
+    # Connect to Telegram (a borrowed crawler only needs a health check)
+    connected = await telegram_crawler.connect() if owns_crawler else await telegram_crawler.ensure_connected()
+    if not connected:
+        results_store.close()
+        if scratch_dir:
+            shutil.rmtree(scratch_dir, ignore_errors=True)
         logger.error("Failed to connect to Telegram. Exiting.")
         return {
             "total_channels": len(input_channels),
@@ -285,50 +1867,135 @@ async def process_channels(input_channels: List[str], config: Dict[str, Any]) ->
     headers = ["Source Channel", "Title", "Username", "URL", "Members", "Category"]
     all_rows = []  # Collect all rows for export
     
-    # Process each channel with rate limiting
-    for idx, channel in enumerate(input_channels, 1):
-        logger.info(f"Processing channel {idx}/{total_channels}: {channel}")
+    # The results view and export default to what this run finds
+    results_store.start_run(input_channels)
+    
+    # Order seeds by expected yield and enforce the run budget when configured
+    scheduler = SeedScheduler(config.get('max_runtime'), config.get('max_api_calls'))
+    if config.get('prioritize_seeds'):
+        input_channels = scheduler.order(input_channels, results_store)
+    start_api_calls = telegram_crawler.api_calls
+    stop_reason = None
+    remaining_channels = []
+    
+    # Process each channel with rate limiting, batch_size seeds per recommendations round trip
+    batch_size = max(1, config.get('recommendation_batch_size', 1))
+    queue = deque(input_channels)
+    deferred_channels = set()
+    skipped_channels = []
+    idx = 0
+    while queue:
+        stop_reason = scheduler.exhausted(telegram_crawler.api_calls - start_api_calls)
+        if stop_reason:
+            remaining_channels = list(queue)
+            logger.warning(f"Stopping early: {stop_reason}. {len(remaining_channels)} seeds left over")
+            break
         
-        try:
-            similar_channels = await telegram_crawler.get_similar_channels(channel)
+        batch = []
+        while queue and len(batch) < batch_size:
+            channel = queue.popleft()
             
-            if similar_channels:
-                # Store the similar channels for this input channel
-                channel_similar_channels[channel] = similar_channels
+            # Skip or defer seeds whose previously seen neighbourhood is already covered
+            if clusterer:
+                match = clusterer.match(channel, results_store.recommendations_for(channel))
+                if match and clusterer.mode == 'skip':
+                    representative, similarity = match
+                    logger.info(f"Skipping {channel}: overlaps {representative} (similarity {similarity:.2f})")
+                    clusterer.record_skip(channel, representative)
+                    skipped_channels.append(channel)
+                    continue
+                if match and channel not in deferred_channels:
+                    representative, similarity = match
+                    logger.info(f"Deferring {channel}: overlaps {representative} (similarity {similarity:.2f})")
+                    clusterer.record_deferral(channel, representative)
+                    deferred_channels.add(channel)
+                    queue.append(channel)
+                    continue
+            
+            batch.append(channel)
+        
+        batch_results = {}
+        if len(batch) > 1:
+            try:
+                batch_results = await telegram_crawler.get_similar_channels_batch(batch)
+            except Exception as e:
+                logger.error(f"Error processing batch {batch}: {e}")
+        
+        for channel in batch:
+            idx += 1
+            logger.info(f"Processing channel {idx}/{total_channels}: {channel}")
+            
+            try:
+                if len(batch) > 1:
+                    similar_channels = batch_results.get(channel)
+                else:
+                    similar_channels = await telegram_crawler.get_similar_channels(channel)
+            
+                if similar_channels:
+                    # Store the similar channels for this input channel
+                    channel_similar_channels[channel] = similar_channels
+                    new_count = results_store.add_recommendations(channel, similar_channels)
+                    results_store.record_seed_crawl(channel, len(similar_channels), new_count)
+                    member_history.append([
+                        (info["id"], info["members"]) for info in similar_channels
+                        if info.get("id") is not None and info.get("members") is not None
+                    ])
+                    if clusterer:
+                        clusterer.add(channel, [info["username"] for info in similar_channels])
                 
-                # Prepare rows for export
-                for channel_info in similar_channels:
-                    row = [
-                        channel,  # Source channel
-                        channel_info["title"],
-                        channel_info["username"],
-                        channel_info["url"],
-                        str(channel_info["members"]) if channel_info["members"] else "Unknown",
-                        channel_info.get("category", "Unknown")
-                    ]
-                    all_rows.append(row)
+                    # Prepare rows for export
+                    for channel_info in similar_channels:
+                        row = [
+                            channel,  # Source channel
+                            channel_info["title"],
+                            channel_info["username"],
+                            channel_info["url"],
+                            str(channel_info["members"]) if channel_info["members"] else "Unknown",
+                            channel_info.get("category", "Unknown")
+                        ]
+                        all_rows.append(row)
                 
-                all_similar_channels.extend(similar_channels)
-                successful_channels += 1
-            else:
-                logger.warning(f"No similar channels found for {channel}")
+                    all_similar_channels.extend(similar_channels)
+                    successful_channels += 1
+                elif similar_channels is not None:
+                    logger.warning(f"No similar channels found for {channel}")
+                    results_store.record_seed_crawl(channel, 0, 0)
+                    failed_channels += 1
+                else:
+                    # Not crawled (flood wait, error or not a channel), so its history stays as it was
+                    logger.warning(f"Could not fetch similar channels for {channel}")
+                    failed_channels += 1
+            except Exception as e:
+                logger.error(f"Error processing channel {channel}: {e}")
                 failed_channels += 1
-        except Exception as e:
-            logger.error(f"Error processing channel {channel}: {e}")
-            failed_channels += 1
         
-        # Apply rate limiting
-        if idx < total_channels:
+        # Apply rate limiting (the adaptive controller paces each API call itself)
+        if queue and not telegram_crawler.rate_controller:
             delay = config.get('delay_between_channels', 8)
             logger.info(f"Waiting {delay} seconds before processing next channel")
             await asyncio.sleep(delay)
     
-    # Close Telegram connection
-    await telegram_crawler.close()
+    # Close Telegram connection unless it belongs to the caller
+    if owns_crawler:
+        await telegram_crawler.close()
+    results_store.close()
+    if scratch_dir:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
     
     # Log summary
-    logger.info(f"Completed processing {total_channels} channels")
+    logger.info(f"Completed processing {idx} of {total_channels} channels")
     logger.info(f"Successful: {successful_channels}, Failed: {failed_channels}")
+    if clusterer:
+        logger.info(f"Skipped {len(skipped_channels)} seeds covered by already crawled clusters")
+    logger.info(f"Used {telegram_crawler.api_calls - start_api_calls} API calls in {scheduler.elapsed():.1f}s")
+    if telegram_crawler.hedged_calls:
+        logger.info(f"Hedged {telegram_crawler.hedged_calls} slow calls")
+    if telegram_crawler.rate_controller:
+        if not replaying:
+            telegram_crawler.rate_controller.save()
+        for method, state in telegram_crawler.rate_controller.summary().items():
+            logger.info(f"Rate for {method}: {state['start_rate']} -> {state['rate']} req/s "
+                        f"({state['increases']} increases, {state['decreases']} decreases)")
     logger.info(f"Total similar channels found: {len(all_similar_channels)}")
     
     # Organize similar channels by input channel
@@ -355,6 +2022,14 @@ async def process_channels(input_channels: List[str], config: Dict[str, Any]) ->
         'similar_channels': usernames,
         'timestamp': datetime.now().isoformat()
     }
+    if clusterer:
+        result_data['seed_clusters'] = clusterer.report()
+        result_data['skipped_channels'] = skipped_channels
+    if telegram_crawler.rate_controller:
+        result_data['rate_control'] = telegram_crawler.rate_controller.summary()
+    if stop_reason:
+        result_data['stop_reason'] = stop_reason
+        result_data['remaining_channels'] = remaining_channels
     
     with open(output_file, 'w') as f:
         json.dump(result_data, f, indent=2)
@@ -362,15 +2037,34 @@ async def process_channels(input_channels: List[str], config: Dict[str, Any]) ->
         
     return result_data
 
-def load_config() -> Dict[str, Any]:
-    """Load configuration from environment variables."""
+def load_config(require_credentials: bool = True) -> Dict[str, Any]:
+    """Load configuration from environment variables.
+    
+    Offline modes such as planning pass require_credentials=False.
+    """
     config = {
         'telegram_api_id': os.getenv('TELEGRAM_API_ID'),
         'telegram_api_hash': os.getenv('TELEGRAM_API_HASH'),
         'telegram_phone': os.getenv('TELEGRAM_PHONE'),
         'telegram_session': os.getenv('TELEGRAM_SESSION', 'crawler'),
         'delay_between_channels': int(os.getenv('DELAY_BETWEEN_CHANNELS', '3')),
-        'batch_size': int(os.getenv('BATCH_SIZE', '50'))
+        'batch_size': int(os.getenv('BATCH_SIZE', '50')),
+        'results_db': os.getenv('RESULTS_DB', os.path.join('data', 'crawler.db')),
+        'call_timeouts': {
+            'get_entity': float(os.getenv('GET_ENTITY_TIMEOUT', '15')),
+            'get_channel_recommendations': float(os.getenv('RECOMMENDATIONS_TIMEOUT', '20')),
+            'get_full_channel': float(os.getenv('FULL_CHANNEL_TIMEOUT', '15'))
+        },
+        'max_retries': int(os.getenv('MAX_RETRIES', '2')),
+        'retry_backoff': float(os.getenv('RETRY_BACKOFF', '1.0')),
+        'hedge_percentile': float(os.getenv('HEDGE_PERCENTILE')) if os.getenv('HEDGE_PERCENTILE') else None,
+        'adaptive_rate': os.getenv('ADAPTIVE_RATE', '1').lower() not in ('0', 'false', 'no'),
+        'rate_state_file': os.getenv('RATE_STATE_FILE', os.path.join('data', 'rate_state.json')),
+        'max_flood_wait': float(os.getenv('MAX_FLOOD_WAIT', '120')),
+        'recommendation_batch_size': int(os.getenv('RECOMMENDATION_BATCH_SIZE', '1')),
+        'member_history_dir': os.getenv('MEMBER_HISTORY_DIR', os.path.join('data', 'members')),
+        'seed_clustering': os.getenv('SEED_CLUSTERING') or None,
+        'seed_cluster_threshold': float(os.getenv('SEED_CLUSTER_THRESHOLD', '0.8'))
     }
     
     # Validate required configs
@@ -382,7 +2076,7 @@ def load_config() -> Dict[str, Any]:
     if not config['telegram_api_hash']:
         missing_configs.append('TELEGRAM_API_HASH')
     
-    if missing_configs:
+    if missing_configs and require_credentials:
         logger.error(f"Missing required configuration: {', '.join(missing_configs)}")
         logger.error("Please check your .env file or environment variables")
         sys.exit(1)
@@ -397,15 +2091,109 @@ def parse_arguments():
     input_group = parser.add_mutually_exclusive_group(required=True)
     input_group.add_argument('--channels', nargs='+', help='List of Telegram channel usernames')
     input_group.add_argument('--file', help='Path to a JSON or CSV file containing channel usernames')
+    input_group.add_argument('--search', help='Search previously discovered channels instead of crawling')
+    input_group.add_argument('--growth', type=float, metavar='DAYS',
+                             help='Show the channels whose member counts grew most over the last DAYS days')
     
     # Optional arguments
     parser.add_argument('--log-level', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'], default='INFO',
                        help='Set logging level (default: INFO)')
     parser.add_argument('--delay', type=int, help='Delay between processing channels (seconds)')
     parser.add_argument('--session', help='Custom session name for Telegram client')
+    parser.add_argument('--cluster-seeds', choices=SeedClusterer.MODES,
+                       help='Skip or deprioritize seeds whose recommendations overlap already crawled seeds')
+    parser.add_argument('--cluster-threshold', type=float,
+                       help='Estimated Jaccard similarity above which seeds are clustered (default: 0.8)')
+    parser.add_argument('--no-adaptive-rate', action='store_true',
+                       help='Use the static delay between channels instead of the adaptive rate controller')
+    parser.add_argument('--call-timeout', type=float, metavar='SECONDS',
+                       help='Deadline for every Telegram API call (overrides the per-method settings)')
+    parser.add_argument('--max-retries', type=int,
+                       help='Retries for transient network or server errors (default: 2)')
+    parser.add_argument('--hedge-percentile', type=float,
+                       help='Send a duplicate read when a call runs past this latency percentile (e.g. 95)')
+    parser.add_argument('--batch-size', type=int,
+                       help='Seeds whose recommendations are fetched in one round trip (default: 1)')
+    parser.add_argument('--plan', action='store_true',
+                       help='Estimate API calls and runtime for the input without crawling or touching the network')
+    parser.add_argument('--prioritize', action='store_true',
+                       help='Crawl seeds in order of expected new channels instead of file order')
+    parser.add_argument('--max-runtime', type=float, metavar='SECONDS',
+                       help='Stop cleanly after this many seconds and report the seeds left over')
+    parser.add_argument('--max-api-calls', type=int,
+                       help='Stop cleanly after this many Telegram API calls')
+    parser.add_argument('--record', metavar='CASSETTE',
+                       help='Record every Telegram API response to a cassette file')
+    parser.add_argument('--replay', metavar='CASSETTE',
+                       help='Serve the crawl from a recorded cassette without network access')
+    parser.add_argument('--replay-latency', choices=Cassette.LATENCY_MODES, default='zero',
+                       help='Replay at zero or at recorded latency (default: zero)')
+    parser.add_argument('--growth-by', choices=['absolute', 'relative'], default='absolute',
+                       help='Rank --growth by absolute or relative member growth (default: absolute)')
+    parser.add_argument('--search-limit', type=int, default=20,
+                       help='Maximum number of search or growth results to show (default: 20)')
     
     return parser.parse_args()
 
+def search_channels(query: str, limit: int = 20) -> List[Dict[str, Any]]:
+    """Search the results store and print ranked matches."""
+    store = ResultsStore(os.getenv('RESULTS_DB'))
+    try:
+        results = store.search(query, limit=limit)
+    finally:
+        store.close()
+    
+    if not results:
+        print(f"No channels found matching: {query}")
+        return results
+    
+    for idx, channel in enumerate(results, 1):
+        members = channel['members'] if channel['members'] is not None else "Unknown"
+        print(f"{idx:>3}. @{channel['username']} - {channel['title']} (members: {members})")
+    return results
+
+def show_top_movers(days: float, limit: int = 20, by: str = 'absolute') -> List[Dict[str, Any]]:
+    """Print the channels with the largest member growth over the last `days` days."""
+    movers = MemberHistory(os.getenv('MEMBER_HISTORY_DIR')).top_movers(days, limit=limit, by=by)
+    if not movers:
+        print(f"No channels with at least two member observations in the last {days:g} days")
+        return movers
+    
+    store = ResultsStore(os.getenv('RESULTS_DB'))
+    try:
+        usernames = store.usernames_for_ids([mover['channel_id'] for mover in movers])
+    finally:
+        store.close()
+    
+    for idx, mover in enumerate(movers, 1):
+        mover['username'] = usernames.get(mover['channel_id'])
+        name = f"@{mover['username']}" if mover['username'] else f"id {mover['channel_id']}"
+        print(f"{idx:>3}. {name}: {mover['start']} -> {mover['end']} "
+              f"({mover['growth']:+d}, {mover['growth_rate']:+.1%})")
+    return movers
+
+def show_plan(seeds: Iterable[Any], config: Dict[str, Any]) -> Dict[str, Any]:
+    """Print the estimated API calls and runtime of crawling the given seeds."""
+    plan = CrawlPlanner(config).plan(seeds)
+    counts = plan['seeds']
+    
+    print(f"Seeds: {counts['input']} read, {counts['invalid']} invalid, {counts['duplicates']} duplicates, "
+          f"{counts['unique']} to crawl")
+    print(f"  {counts['cached_entities']} in the entity cache, {counts['crawled_before']} crawled before, "
+          f"{counts['known_channels']} already discovered")
+    print(f"Fan-out: {plan['fan_out']['average']} recommendations per seed ({plan['fan_out']['source']})")
+    for method, count in plan['calls'].items():
+        print(f"  {method}: {count} calls")
+    print(f"Total: {plan['total_calls']} API calls in {plan['round_trips']} round trips "
+          f"(batch size {plan['batch_size']})")
+    print(f"Projected runtime: {plan['runtime_seconds'] / 3600:.2f} h ({plan['runtime_seconds']:.0f}s)")
+    if 'budget' in plan:
+        budget = plan['budget']
+        verdict = "fits" if budget['fits'] else f"covers about {budget['seeds_within_budget']} seeds"
+        print(f"Budget: {verdict}")
+    print(f"Planned in {plan['plan_seconds']}s")
+    return plan
+
 async def main():
     """Main entry point of the application."""
     # Parse command line arguments
@@ -414,12 +2202,49 @@ async def main():
     # Set log level
     logging.getLogger().setLevel(getattr(logging, args.log_level))
     
-    # Load configuration
-    config = load_config()
+    # Searching only reads the local results store, so it needs no Telegram config
+    if args.search:
+        search_channels(args.search, args.search_limit)
+        return
+    if args.growth:
+        show_top_movers(args.growth, args.search_limit, args.growth_by)
+        return
+    
+    # Load configuration (planning is offline, so it works without Telegram credentials)
+    config = load_config(require_credentials=not args.plan)
     
     # Override config with command line arguments if provided
     if args.delay:
         config['delay_between_channels'] = args.delay
+    if args.cluster_seeds:
+        config['seed_clustering'] = args.cluster_seeds
+    if args.no_adaptive_rate:
+        config['adaptive_rate'] = False
+    if args.call_timeout:
+        config['call_timeouts'] = {method: args.call_timeout for method in config['call_timeouts']}
+    if args.max_retries is not None:
+        config['max_retries'] = args.max_retries
+    if args.hedge_percentile:
+        config['hedge_percentile'] = args.hedge_percentile
+    if args.batch_size:
+        config['recommendation_batch_size'] = args.batch_size
+    if args.prioritize:
+        config['prioritize_seeds'] = True
+    if args.max_runtime is not None:
+        config['max_runtime'] = args.max_runtime
+    if args.max_api_calls is not None:
+        config['max_api_calls'] = args.max_api_calls
+    if args.record:
+        config['record_cassette'] = args.record
+    if args.replay:
+        config['replay_cassette'] = args.replay
+        config['replay_latency'] = args.replay_latency
+    if args.cluster_threshold is not None:
+        config['seed_cluster_threshold'] = args.cluster_threshold
+    
+    if args.plan:
+        show_plan(args.channels if args.channels else InputHandler.iter_file(args.file), config)
+        return
     
     # Load input channels
     input_channels = []